@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""clean_html 的复杂度基准测试
+
+按节点数成倍增加页面大小，对比旧实现（逐个标签调用 find_next/find_previous）
+与当前线性实现的耗时，并检查两者在所有测试页面上的输出完全一致。
+
+用法：
+    python benchmarks/bench_clean_html.py [--nodes 500 1000 2000 4000] [--skip-legacy-above 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bs4 import BeautifulSoup, Comment
+
+from web2md import Web2Markdown
+import fixtures
+
+
+def legacy_clean_html(soup):
+    """旧的 clean_html 实现，仅用于对比"""
+    for name in ('script', 'style', 'link', 'meta'):
+        for tag in soup.find_all(name):
+            tag.decompose()
+    for comment in soup.find_all(string=lambda string: isinstance(string, Comment)):
+        comment.extract()
+    for figure in soup.find_all('figure'):
+        figcaption = figure.find('figcaption')
+        if figcaption:
+            br = soup.new_tag('br')
+            figcaption.insert_after(br)
+            next_element = figcaption.next_sibling
+            while next_element and isinstance(next_element, str) and not next_element.strip():
+                next_element = next_element.next_sibling
+            if next_element and next_element.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+                br2 = soup.new_tag('br')
+                figcaption.insert_after(br2)
+    for tag in soup.find_all():
+        if tag.name in ['figure', 'img', 'br', 'hr', 'div', 'p', 'figcaption']:
+            continue
+        if tag.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+            continue
+        if tag.find_all(['img', 'video', 'iframe'], recursive=False):
+            continue
+        if (tag.find_next(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']) or
+                tag.find_previous(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])):
+            continue
+        if len(tag.get_text(strip=True)) == 0:
+            tag.replace_with(soup.new_string('\n'))
+    for tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+        for heading in soup.find_all(tag):
+            if heading.previous_sibling and isinstance(heading.previous_sibling, str):
+                heading.insert_before(soup.new_string('\n\n'))
+            if heading.next_sibling and isinstance(heading.next_sibling, str):
+                heading.insert_after(soup.new_string('\n\n'))
+    return soup
+
+
+def corpus():
+    """用于检查输出一致性的页面"""
+    pages = {
+        'article-10': fixtures.article_html(10),
+        'article-images': fixtures.article_html(20, images=8),
+        'generic-500': fixtures.generic_html(500),
+        'headings-only-in-tail': fixtures.generic_html(300) + '<h2>tail</h2><p>x</p>',
+        'nested-empty': '<section><span><b></b><i> </i></span><ul><li></li><li>x</li></ul>'
+                        '<figure><img src="a.png"><figcaption>c</figcaption> <h3>t</h3></figure>'
+                        '<ruby>漢<rt></rt></ruby><template><p>t</p></template></section>',
+    }
+    for name, html in pages.items():
+        yield name, html
+
+
+def check_corpus(converter):
+    ok = True
+    for name, html in corpus():
+        expected = str(legacy_clean_html(BeautifulSoup(html, 'html.parser')))
+        actual = str(converter.clean_html(BeautifulSoup(html, 'html.parser')))
+        status = '一致' if expected == actual else '不一致'
+        ok = ok and expected == actual
+        print(f"{name:>24}: {status}")
+    return ok
+
+
+def timed(clean, html):
+    soup = BeautifulSoup(html, 'html.parser')
+    start = time.perf_counter()
+    clean(soup)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='clean_html 复杂度基准测试')
+    parser.add_argument('--nodes', type=int, nargs='+', default=[500, 1000, 2000, 4000, 8000, 16000, 32000],
+                        help='页面节点数')
+    parser.add_argument('--skip-legacy-above', type=int, default=2000,
+                        help='节点数超过该值时不再运行旧实现')
+    args = parser.parse_args()
+    
+    converter = Web2Markdown('https://example.com/article', os.devnull)
+    print("输出一致性检查:")
+    ok = check_corpus(converter)
+    
+    print(f"\n{'节点数':>8} {'旧实现(秒)':>12} {'线性实现(秒)':>14}")
+    for nodes in args.nodes:
+        html = fixtures.generic_html(nodes)
+        legacy = timed(legacy_clean_html, html) if nodes <= args.skip_legacy_above else None
+        current = timed(converter.clean_html, html)
+        legacy_text = f'{legacy:.3f}' if legacy is not None else '-'
+        print(f"{nodes:>8} {legacy_text:>12} {current:>14.4f}")
+    
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""端到端基准测试：启动本地模拟服务器，测量完整转换流程的吞吐、延迟和内存
+
+每个场景在独立的子进程中运行，分别统计峰值RSS。结果可保存为JSON，
+下次运行时用 --compare 对比，超过阈值的退化会被标出。
+
+用法：
+    python benchmarks/bench_e2e.py [--scenarios zhihu generic-100] [--pages 5] [--workers 1]
+                                   [--latency 20] [--throttle-every 50] [--slow-images 0.05]
+                                   [--save result.json] [--compare baseline.json]
+                                   [web2md 的转换参数，如 --engine async --image-workers 16]
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, BENCH_DIR)
+
+import stub_server
+
+# 场景名称 -> 第 i 个页面的路径
+SCENARIOS = {
+    'zhihu': '/zhuanlan.zhihu.com/p/{}',
+    'segmentfault': '/segmentfault.com/a/{}',
+    'generic-10': '/generic/10/{}.html',
+    'generic-100': '/generic/100/{}.html',
+    'generic-1000': '/generic/1000/{}.html',
+}
+
+# 指标名称 -> (显示名称, 数值越大越好)
+METRICS = {
+    'pages_per_sec': ('页面/秒', True),
+    'images_per_sec': ('图片/秒', True),
+    'p50': ('P50(秒)', False),
+    'p99': ('P99(秒)', False),
+    'peak_rss_mb': ('峰值RSS(MB)', False),
+}
+
+
+def percentile(values, p):
+    """最近秩法计算百分位数"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_scenario(base_url, scenario, pages, workers, conversion_argv):
+    """在当前进程中运行一个场景，返回结果字典（由子进程调用）"""
+    import web2md
+    web2md.Web2Markdown.ZHIHU_API = base_url + '/api/v4/articles/{}'
+    
+    parser = argparse.ArgumentParser()
+    web2md.add_conversion_arguments(parser)
+    # 默认不使用HTTP缓存，避免第二次运行变成缓存命中
+    parser.set_defaults(no_cache=True, quiet=True)
+    args = parser.parse_args(conversion_argv)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        args.image_dir = os.path.join(tmp, 'i')
+        options = web2md.conversion_options(args)
+        entries = [(i, base_url + SCENARIOS[scenario].format(i), os.path.join(tmp, f'page{i}.md'))
+                   for i in range(1, pages + 1)]
+        start = time.perf_counter()
+        try:
+            results = web2md.run_batch(entries, workers, **options)
+        finally:
+            web2md.close_conversion_options(options)
+        elapsed = time.perf_counter() - start
+    
+    failed = [error for _, _, error, _ in results if error is not None]
+    stats = [stats for _, _, _, stats in results if stats is not None]
+    latencies = [s.timings['total'] for s in stats] or [0.0]
+    images = sum(s.counters['images_downloaded'] for s in stats)
+    return {
+        'pages': len(stats),
+        'failed': len(failed),
+        'images': images,
+        'retries': sum(s.counters['retries'] for s in stats),
+        'elapsed': elapsed,
+        'pages_per_sec': len(stats) / elapsed,
+        'images_per_sec': images / elapsed,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        # Linux 上 ru_maxrss 的单位是KB
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def start_server(args):
+    """在子进程中启动模拟服务器，返回 (进程, 服务地址)"""
+    command = [sys.executable, os.path.join(BENCH_DIR, 'stub_server.py'), '--port', '0',
+               '--latency', str(args.latency), '--throttle-every', str(args.throttle_every),
+               '--retry-after', str(args.retry_after), '--slow-images', str(args.slow_images),
+               '--slow-delay', str(args.slow_delay), '--image-size', str(args.image_size),
+               '--sections', str(args.sections), '--article-images', str(args.article_images)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    return process, process.stdout.readline().strip()
+
+
+def compare(results, baseline, threshold):
+    """打印与基准结果的对比，返回退化的指标数"""
+    regressions = 0
+    print(f"\n与基准结果对比（阈值 {threshold:.0f}%）:")
+    for scenario, result in results.items():
+        if scenario not in baseline:
+            continue
+        for metric, (label, higher_is_better) in METRICS.items():
+            old, new = baseline[scenario][metric], result[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            worse = -change if higher_is_better else change
+            mark = ''
+            if worse > threshold:
+                mark = '  <-- 退化'
+                regressions += 1
+            print(f"{scenario:>14} {label:>12} {old:>10.3f} -> {new:>10.3f} ({change:+.1f}%){mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS),
+                        help='要运行的场景 (默认: 全部)')
+    parser.add_argument('--pages', type=int, default=5, help='每个场景转换的页面数 (默认: 5)')
+    parser.add_argument('--workers', type=int, default=1, help='同时转换的页面数 (默认: 1)')
+    parser.add_argument('--save', help='将结果保存为JSON文件')
+    parser.add_argument('--compare', help='与之前保存的JSON结果对比')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='对比时视为退化的变化百分比 (默认: 10)')
+    parser.add_argument('--run-scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    stub_server.add_server_arguments(parser)
+    # 其余参数原样传给 web2md 的转换选项
+    args, conversion_argv = parser.parse_known_args()
+    
+    if args.run_scenario:
+        result = run_scenario(args.base_url, args.run_scenario, args.pages, args.workers, conversion_argv)
+        print(json.dumps(result))
+        return
+    
+    server, base_url = start_server(args)
+    results = {}
+    try:
+        print(f"{'场景':>14} {'页面':>6} {'图片':>7} {'重试':>5} "
+              + ' '.join(f'{label:>12}' for label, _ in METRICS.values()))
+        for scenario in args.scenarios:
+            command = [sys.executable, os.path.abspath(__file__), '--run-scenario', scenario,
+                       '--base-url', base_url, '--pages', str(args.pages),
+                       '--workers', str(args.workers)] + conversion_argv
+            output = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout
+            result = results[scenario] = json.loads(output.strip().splitlines()[-1])
+            print(f"{scenario:>14} {result['pages']:>6} {result['images']:>7} {result['retries']:>5} "
+                  + ' '.join(f'{result[metric]:>12.3f}' for metric in METRICS))
+            if result['failed']:
+                print(f"警告：{scenario} 有 {result['failed']} 个页面转换失败")
+    finally:
+        server.terminate()
+        server.wait()
+    
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'argv': sys.argv[1:], 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.save}")
+    
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""对比 markdownify 默认转换器与 FastMarkdownConverter 的转换耗时
+
+页面为 fixtures.code_heavy_html 生成的代码密集型文章：大段 highlight.js 高亮代码
+和一张宽表格。只计时Markdown转换本身，文档树在计时前解析好，两个转换器使用
+相同的参数。最后列出两者输出中不同的代码块数量，便于确认差异只来自代码块。
+
+用法：
+    python benchmarks/bench_markdown.py [--blocks 5 20 80] [--lines 200] [--table-rows 200] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bs4 import BeautifulSoup
+from markdownify import MarkdownConverter
+
+from web2md import FastMarkdownConverter
+import fixtures
+
+OPTIONS = dict(heading_style='ATX', bullets='-', strip=['script', 'style', 'meta', 'link', 'xml'])
+
+
+def timed(converter_class, html, repeat):
+    """返回多次转换中最短的耗时和转换结果；转换会修改文档树，每次重新解析"""
+    best, markdown = None, None
+    for _ in range(repeat):
+        soup = BeautifulSoup(html, 'html.parser')
+        converter = converter_class(**OPTIONS)
+        start = time.perf_counter()
+        markdown = converter.convert_soup(soup)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, markdown
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Markdown转换器基准测试')
+    parser.add_argument('--blocks', type=int, nargs='+', default=[5, 20, 80], help='代码块数量')
+    parser.add_argument('--lines', type=int, default=200, help='每个代码块的行数 (默认: 200)')
+    parser.add_argument('--table-rows', type=int, default=200, help='表格行数 (默认: 200)')
+    parser.add_argument('--repeat', type=int, default=3, help='每种配置重复次数，取最短耗时 (默认: 3)')
+    args = parser.parse_args()
+    
+    print(f"{'代码块':>6} {'HTML(KB)':>9} {'markdownify(秒)':>16} {'快速转换(秒)':>13} {'加速':>6}")
+    for blocks in args.blocks:
+        html = fixtures.code_heavy_html(blocks, args.lines, args.table_rows)
+        stock, stock_markdown = timed(MarkdownConverter, html, args.repeat)
+        fast, fast_markdown = timed(FastMarkdownConverter, html, args.repeat)
+        print(f"{blocks:>6} {len(html) / 1024:>9.0f} {stock:>16.3f} {fast:>13.3f} {stock / fast:>5.1f}x")
+    
+    # markdownify 会转义高亮 <span> 中的下划线和星号，并折叠其中的空白
+    stock_fences = stock_markdown.count('```') // 2
+    escaped = sum(1 for line in stock_markdown.splitlines() if 'value\\_' in line)
+    print(f"\nmarkdownify 输出 {stock_fences} 个代码块，其中 {escaped} 行代码被错误转义；"
+          f"快速转换输出 {fast_markdown.count('```javascript')} 个带语言标记的代码块")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""对比旧的三次解析流程与单次解析流程的CPU时间和内存峰值
+
+用法：
+    python benchmarks/bench_pipeline.py [--sections 50 200 500] [--repeat 3]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bs4 import BeautifulSoup
+from web2md import FastMarkdownConverter, Web2Markdown
+import fixtures
+
+
+def legacy_pipeline(converter, html):
+    """旧流程：解析→清理→序列化→再解析→标题处理→序列化→Markdown转换器再解析
+    
+    两种流程使用同一个Markdown转换器，只比较解析次数的差别。
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    processed_html = str(converter.process_html(soup))
+    soup = BeautifulSoup(processed_html, 'html.parser')
+    converter.normalize_headings(soup)
+    return FastMarkdownConverter(
+        heading_style="ATX",
+        bullets="-",
+        strip=['script', 'style', 'meta', 'link', 'xml']
+    ).convert(str(soup))
+
+
+def single_parse_pipeline(converter, html):
+    """新流程：同一棵文档树从解析一直传递到Markdown转换"""
+    return converter.html_to_markdown(html)
+
+
+def measure(pipeline, html, repeat):
+    """返回 (最短CPU时间, 内存峰值字节数, 输出)"""
+    best = None
+    for _ in range(repeat):
+        converter = Web2Markdown('https://example.com/article', os.devnull)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.process_time()
+            output = pipeline(converter, html)
+            elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    
+    converter = Web2Markdown('https://example.com/article', os.devnull)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        pipeline(converter, html)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return best, peak, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=int, nargs='+', default=[50, 200, 500], help='页面章节数')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最短CPU时间')
+    args = parser.parse_args()
+    
+    print(f"{'页面大小':>10} {'流程':>8} {'CPU(秒)':>10} {'内存峰值(MB)':>14}")
+    for sections in args.sections:
+        html = fixtures.article_html(sections)
+        size = f'{len(html) / 1024:.0f}KB'
+        results = {}
+        for name, pipeline in (('旧流程', legacy_pipeline), ('单次解析', single_parse_pipeline)):
+            cpu, peak, output = measure(pipeline, html, args.repeat)
+            results[name] = output
+            print(f"{size:>10} {name:>8} {cpu:>10.3f} {peak / 1024 / 1024:>14.1f}")
+        if results['旧流程'] != results['单次解析']:
+            print(f"警告：{size} 页面两种流程的输出不一致")
+
+
+if __name__ == '__main__':
+    main()
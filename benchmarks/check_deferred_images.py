@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""检查延迟下载的图片格式是否与Markdown中已写入的扩展名一致
+
+本地服务器以不同的URL提供WebP和PNG图片（URL扩展名与实际格式不一致或没有扩展名），
+先用 --defer-images 转换，再用 fetch-images 下载，检查每个图片文件的实际格式
+与其扩展名一致。分别检查默认设置、--keep-webp 和 --optimize-images。
+
+用法：
+    python benchmarks/check_deferred_images.py
+"""
+import contextlib
+import io
+import os
+import re
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import web2md
+
+
+def encode(image_format):
+    output = io.BytesIO()
+    Image.new('RGBA', (16, 16), (255, 0, 0, 128)).save(output, image_format)
+    return output.getvalue()
+
+
+# 图片路径 -> (内容类型, 数据)
+IMAGES = {
+    '/img/v2-abc_r.jpg': ('image/webp', encode('WEBP')),
+    '/img/noext': ('image/webp', encode('WEBP')),
+    '/img/photo.webp': ('image/webp', encode('WEBP')),
+    '/img/shot.gif': ('image/png', encode('PNG')),
+}
+
+PAGE = ('<html><body><article><h1>延迟下载</h1><p>' + '正文内容。' * 40 + '</p>'
+        + ''.join(f'<p><img src="{path}"></p>' for path in IMAGES) + '</article></body></html>').encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        content_type, body = IMAGES.get(self.path, ('text/html; charset=utf-8', PAGE))
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def run(url, options):
+    """在临时目录中延迟转换并下载图片，返回 [(图片路径, 实际扩展名)]"""
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                web2md.main([url, 'a.md', '--defer-images', '--no-cache', '-q'] + options)
+                web2md.main(['fetch-images', '--no-cache', '-q'] + options)
+            with open('a.md', encoding='utf-8') as f:
+                paths = re.findall(r'!\[\]\(([^)]+)\)', f.read())
+            results = []
+            for path in paths:
+                with open(path, 'rb') as f:
+                    results.append((path, web2md.sniff_image_type(f.read(16))))
+            return results
+        finally:
+            os.chdir(cwd)
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/post'
+
+    failed = False
+    try:
+        for options in ([], ['--keep-webp'], ['--optimize-images']):
+            name = ' '.join(options) or '默认'
+            for path, actual in run(url, options):
+                expected = os.path.splitext(path)[1]
+                if actual == expected:
+                    print(f"[一致] {name:>17} {path}")
+                else:
+                    failed = True
+                    print(f"[不一致] {name:>17} {path}: 实际格式 {actual}")
+    finally:
+        server.shutdown()
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""检查不同解析器生成的Markdown是否与基准文件一致
+
+对 benchmarks/fixtures.py 生成的每个页面，分别使用所有已安装的解析器转换，
+并与 benchmarks/golden/ 下的基准Markdown文件逐字节比较。图片不访问网络，
+而是按图片URL生成确定的本地路径，只检查图片提取和链接替换的结果。
+
+用法：
+    python benchmarks/check_parsers.py            # 检查所有已安装的解析器
+    python benchmarks/check_parsers.py --update   # 用 html.parser 重新生成基准文件
+"""
+import argparse
+import contextlib
+import difflib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from web2md import Web2Markdown, available_parsers
+import fixtures
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+
+class OfflineConverter(Web2Markdown):
+    """不下载图片，按URL生成确定的本地路径"""
+    
+    def _try_download_image(self, img_url, index, attempt):
+        return f'i/image_{index}_{os.path.basename(img_url)}', None
+
+
+def pages():
+    """参与比较的页面：(名称, 页面URL, HTML)"""
+    yield 'article', 'https://example.com/post/1', fixtures.article_html(12, images=6)
+    yield 'generic', 'https://example.com/list', fixtures.generic_html(400)
+    yield 'zhihu-fragment', 'https://zhuanlan.zhihu.com/p/1', (
+        '<h1>知乎标题</h1><p>正文<b>加粗</b></p>'
+        '<figure><noscript><img src="https://pic1.zhimg.com/a.jpg"></noscript>'
+        '<img src="data:image/svg+xml;utf8,&lt;svg&gt;&lt;/svg&gt;" data-actualsrc="https://pic1.zhimg.com/a.jpg">'
+        '<figcaption>图1</figcaption></figure><h2>小节</h2>文本<ul><li>一</li><li>二</li></ul>')
+    yield 'lazy-images', 'https://example.com/lazy', (
+        '<div><p>lazy</p><img data-src="/img/lazy.png"><span data-original="https://cdn.example.com/x.png"></span>'
+        '<img src="rel/y.gif" srcset="rel/y@2x.gif 2x"></div>')
+    yield 'table-caption', 'https://example.com/table', (
+        '<article><h1>表格</h1><p>表格前的段落。</p><table><caption>表1：<b>测试</b>结果</caption>'
+        '<thead><tr><th>名称</th><th>数值</th></tr></thead>'
+        '<tbody><tr><td>甲</td><td>1</td></tr><tr><td>乙</td><td>2</td></tr></tbody></table>'
+        '<p>表格后的段落。</p></article>')
+
+
+def render(parser, url, html):
+    converter = OfflineConverter(url, os.devnull, parser=parser)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return converter.html_to_markdown(html)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检查不同解析器的Markdown输出一致性')
+    parser.add_argument('--update', action='store_true', help='用 html.parser 重新生成基准文件')
+    args = parser.parse_args()
+    
+    if args.update:
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+        for name, url, html in pages():
+            with open(os.path.join(GOLDEN_DIR, f'{name}.md'), 'w', encoding='utf-8') as f:
+                f.write(render('html.parser', url, html))
+            print(f"已更新基准文件: {name}.md")
+        return
+    
+    failed = False
+    for backend in available_parsers():
+        for name, url, html in pages():
+            with open(os.path.join(GOLDEN_DIR, f'{name}.md'), encoding='utf-8') as f:
+                expected = f.read()
+            actual = render(backend, url, html)
+            if actual == expected:
+                print(f"[一致] {backend:>12} {name}")
+                continue
+            failed = True
+            print(f"[不一致] {backend:>12} {name}")
+            diff = difflib.unified_diff(expected.splitlines(), actual.splitlines(),
+                                        'golden', backend, lineterm='', n=1)
+            for line in list(diff)[:20]:
+                print(f"    {line}")
+    
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""基准测试使用的合成页面
+
+页面内容由固定的随机种子生成，每次运行结果一致。
+"""
+import json
+import random
+
+WORDS = ('python markdown parser image cache request session thread process '
+         'network latency memory 缓存 解析 图片 网络 线程 性能 内存 文章 标题 段落').split()
+
+
+def _sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)) + '.'
+
+
+def _code_block(rng, lines):
+    body = '\n'.join(
+        f'    result_{i} = compute(data[{i}], *args, **kwargs)  # &lt;{rng.choice(WORDS)}&gt; &amp; _x_'
+        for i in range(lines))
+    return f'<pre><code class="language-python">def handler(data):\n{body}\n</code></pre>'
+
+
+def _table(rng, rows, cols):
+    head = ''.join(f'<th>col_{c}</th>' for c in range(cols))
+    body = ''.join(
+        '<tr>' + ''.join(f'<td>{rng.choice(WORDS)}_{r}*{c}</td>' for c in range(cols)) + '</tr>'
+        for r in range(rows))
+    return f'<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>'
+
+
+def _highlighted_code_block(rng, lines):
+    """highlight.js 高亮后的代码块，每个词法单元都包在 <span> 中"""
+    body = '\n'.join(
+        f'<span class="hljs-keyword">const</span> <span class="hljs-variable">value_{i}</span> = '
+        f'<span class="hljs-title function_">compute</span>(data[<span class="hljs-number">{i}</span>], '
+        f'<span class="hljs-string">"{rng.choice(WORDS)}_*"</span>); '
+        f'<span class="hljs-comment">// &lt;{rng.choice(WORDS)}&gt; | `x`</span>'
+        for i in range(lines))
+    return f'<pre><code class="hljs language-javascript">{body}\n</code></pre>'
+
+
+def article_html(sections=50, images=0, image_url='img/{}.png', seed=0):
+    """生成一篇技术文章风格的HTML页面
+    
+    Args:
+        sections (int): 章节数量，决定页面大小
+        images (int): 图片数量，按顺序分布在各章节中
+        image_url (str): 图片URL模板，{}替换为图片序号
+        seed (int): 随机种子
+    """
+    rng = random.Random(seed)
+    parts = ['<html><head><title>Fixture</title><meta charset="utf-8">',
+             '<script>var tracking = 1;</script><style>body { color: red; }</style></head><body>',
+             '<nav><ul><li><a href="/">Home</a></li><li><a href="/about">About</a></li></ul></nav>',
+             '<article><h1>Fixture article</h1>']
+    # 图片按顺序均匀分布在各章节中
+    image_slots = [i * sections // images for i in range(images)]
+    image_index = 0
+    for s in range(sections):
+        parts.append(f'<h2>Section {s}</h2>')
+        parts.append(f'intro text {s}')
+        for _ in range(3):
+            parts.append(f'<p>{_sentence(rng, 30)} <strong>{_sentence(rng, 3)}</strong> '
+                         f'<a href="https://example.com/{s}">link</a> <code>inline_{s}</code></p>')
+        parts.append('<ul>' + ''.join(f'<li>{_sentence(rng, 6)}</li>' for _ in range(4)) + '</ul>')
+        if s % 3 == 0:
+            parts.append(f'<h3>Code {s}</h3>' + _code_block(rng, 40))
+        if s % 5 == 0:
+            parts.append(_table(rng, 20, 6))
+        parts.append('<div><span></span><em> </em></div><blockquote>' + _sentence(rng) + '</blockquote>')
+        for _ in range(image_slots.count(s)):
+            parts.append(f'<figure><img src="{image_url.format(image_index)}" alt="figure {image_index}">'
+                         f'<figcaption>Figure {image_index}</figcaption></figure>')
+            image_index += 1
+    parts.append('</article><aside><h4>Related</h4><ul><li>a</li></ul></aside>'
+                 '<footer><p>Copyright</p><!-- comment --></footer></body></html>')
+    return '\n'.join(parts)
+
+
+def generic_html(nodes=1000, seed=0):
+    """生成不含标题的页面，节点数约为 nodes，用于测试清理逻辑的复杂度"""
+    rng = random.Random(seed)
+    parts = ['<html><body><div class="page">']
+    for i in range(nodes // 5):
+        parts.append(f'<div><p>{_sentence(rng, 5)}</p><span></span><b> </b>'
+                     f'<a href="/x{i}">{rng.choice(WORDS)}</a></div>')
+    parts.append('</div></body></html>')
+    return ''.join(parts)
+
+
+def article_fragment(sections=20, images=0, image_url='img/{}.png', seed=0):
+    """生成文章正文片段（不含页面框架），用于知乎接口和 SegmentFault 页面"""
+    html = article_html(sections, images, image_url, seed)
+    return html[html.index('<article>') + len('<article>'):html.index('</article>')]
+
+
+def zhihu_article_json(article_id, sections=20, images=0, image_url='img/{}.png'):
+    """生成知乎 /api/v4/articles/<id> 接口返回的JSON"""
+    return json.dumps({
+        'id': article_id,
+        'title': f'知乎文章 {article_id}',
+        'content': article_fragment(sections, images, image_url, seed=article_id),
+    }, ensure_ascii=False)
+
+
+def segmentfault_html(article_id, sections=20, images=0, image_url='img/{}.png'):
+    """生成 SegmentFault 文章页面，正文位于 article.article-content 中"""
+    return ('<html><head><meta charset="utf-8"><title>SegmentFault</title></head><body>'
+            '<nav><a href="/">SegmentFault</a></nav><div class="container">'
+            f'<h1 class="h1">SegmentFault 文章 {article_id}</h1>'
+            '<article class="article-content">'
+            f'{article_fragment(sections, images, image_url, seed=article_id)}'
+            '</article></div><footer>footer</footer></body></html>')
+
+
+def code_heavy_html(blocks=20, lines=200, table_rows=200, seed=0):
+    """生成以大段高亮代码和宽表格为主的文章页面，用于测试Markdown转换速度
+    
+    Args:
+        blocks (int): 代码块数量，每个代码块后跟一段说明
+        lines (int): 每个代码块的行数
+        table_rows (int): 页面末尾表格的行数，表格共12列
+        seed (int): 随机种子
+    """
+    rng = random.Random(seed)
+    parts = ['<html><head><title>Code</title></head><body><article><h1>Code heavy article</h1>']
+    for b in range(blocks):
+        parts.append(f'<h2>Block {b}</h2><p>{_sentence(rng, 20)} <code>inline_{b}</code></p>')
+        parts.append(_highlighted_code_block(rng, lines))
+    parts.append(_table(rng, table_rows, 12))
+    parts.append('</article></body></html>')
+    return '\n'.join(parts)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""模拟知乎、SegmentFault 和普通网站的本地HTTP服务器，用于离线基准测试
+
+路由：
+    /api/v4/articles/<id>         知乎文章接口JSON（含 --article-images 张图片）
+    /api/v4/columns/<专栏>/items   知乎专栏文章列表，按 offset/limit 分页，共 --listing-size 条
+    /api/v4/members/<用户>/articles 知乎作者文章列表，格式同上
+    /zhuanlan.zhihu.com/p/<id>    知乎文章URL，转换器实际请求的是上面的接口
+    /segmentfault.com/a/<id>      SegmentFault 文章页面（含 --article-images 张图片）
+    /generic/<图片数>/<id>.html    包含指定数量图片的普通页面
+    /img/<页面>/<序号>.png         图片，内容由路径决定
+
+URL中包含 zhihu.com、segmentfault.com，转换器会按对应站点的流程处理。
+
+用法：
+    python benchmarks/stub_server.py [--port 8000] [--latency 20] [--throttle-every 50]
+                                     [--slow-images 0.05 --slow-delay 0.5]
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+
+ROUTES = (
+    (re.compile(r'^/api/v4/articles/(\d+)$'), 'zhihu'),
+    (re.compile(r'^/api/v4/(columns/[\w-]+/items|members/[\w-]+/articles)$'), 'zhihu_listing'),
+    (re.compile(r'^/segmentfault\.com/a/(\d+)$'), 'segmentfault'),
+    (re.compile(r'^/generic/(\d+)/(\d+)\.html$'), 'generic'),
+    (re.compile(r'^/img/([\w-]+)/(\d+)\.png$'), 'image'),
+)
+
+
+def make_png(size, seed):
+    """生成指定边长的噪点PNG图片，几乎无法压缩，大小约为 size*size*3 字节"""
+    rng = random.Random(seed)
+    image = Image.frombytes('RGB', (size, size), rng.randbytes(size * size * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """按 server.options 中的配置返回页面和图片，可模拟延迟、限流和慢速图片"""
+    
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        options = self.server.options
+        if options.latency:
+            time.sleep(options.latency)
+        
+        path = self.path.split('?', 1)[0]
+        for pattern, kind in ROUTES:
+            match = pattern.match(path)
+            if match:
+                return getattr(self, f'serve_{kind}')(*match.groups())
+        self.send_body(404, b'not found', 'text/plain')
+
+    def send_body(self, status, body, content_type, headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve_zhihu(self, article_id):
+        options = self.server.options
+        body = fixtures.zhihu_article_json(int(article_id), options.sections, options.article_images,
+                                           f'/img/zhihu-{article_id}/{{}}.png')
+        self.send_body(200, body.encode('utf-8'), 'application/json; charset=utf-8')
+
+    def serve_zhihu_listing(self, endpoint):
+        query = parse_qs(urlparse(self.path).query)
+        offset = int(query.get('offset', ['0'])[0])
+        limit = int(query.get('limit', ['20'])[0])
+        total = self.server.options.listing_size
+        # 每10条中有一条是回答，转换器应跳过
+        data = [{'id': 1000 + i, 'type': 'answer' if i % 10 == 9 else 'article', 'title': f'Article {i}'}
+                for i in range(offset, min(offset + limit, total))]
+        is_end = offset + limit >= total
+        body = {
+            'data': data,
+            'paging': {
+                'is_end': is_end,
+                'totals': total,
+                'next': None if is_end else f'/api/v4/{endpoint}?limit={limit}&offset={offset + limit}',
+            },
+        }
+        self.send_body(200, json.dumps(body).encode('utf-8'), 'application/json; charset=utf-8')
+
+    def serve_segmentfault(self, article_id):
+        options = self.server.options
+        body = fixtures.segmentfault_html(int(article_id), options.sections, options.article_images,
+                                          f'/img/sf-{article_id}/{{}}.png')
+        self.send_body(200, body.encode('utf-8'), 'text/html; charset=utf-8')
+
+    def serve_generic(self, images, page_id):
+        body = fixtures.article_html(self.server.options.sections, int(images),
+                                     f'/img/generic-{images}-{page_id}/{{}}.png', seed=int(page_id))
+        self.send_body(200, body.encode('utf-8'), 'text/html; charset=utf-8')
+
+    def serve_image(self, page, index):
+        options = self.server.options
+        with self.server.lock:
+            self.server.image_requests += 1
+            throttled = options.throttle_every and self.server.image_requests % options.throttle_every == 0
+        if throttled:
+            return self.send_body(429, b'', 'text/plain', [('Retry-After', str(options.retry_after))])
+        
+        # 按路径决定哪些图片是慢速图片，每次运行结果一致
+        bucket = int(hashlib.md5(self.path.encode()).hexdigest()[:8], 16) % 10000
+        if bucket < options.slow_images * 10000:
+            time.sleep(options.slow_delay)
+        self.send_body(200, self.server.image, 'image/png')
+
+
+def create_server(options, host='127.0.0.1', port=0):
+    """创建服务器，port 为0时由系统分配端口"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.options = options
+    server.lock = threading.Lock()
+    server.image_requests = 0
+    server.image = make_png(options.image_size, 0)
+    return server
+
+
+def add_server_arguments(parser):
+    """添加服务器行为相关的命令行参数，基准测试脚本共用"""
+    parser.add_argument('--latency', type=float, default=0,
+                        help='每个请求的额外延迟，单位毫秒 (默认: 0)')
+    parser.add_argument('--throttle-every', type=int, default=0,
+                        help='每N个图片请求返回一次429，0表示不限流 (默认: 0)')
+    parser.add_argument('--retry-after', type=int, default=1,
+                        help='429响应的 Retry-After 秒数 (默认: 1)')
+    parser.add_argument('--slow-images', type=float, default=0,
+                        help='慢速图片所占比例，0~1 (默认: 0)')
+    parser.add_argument('--slow-delay', type=float, default=0.5,
+                        help='慢速图片的额外延迟，单位秒 (默认: 0.5)')
+    parser.add_argument('--image-size', type=int, default=64,
+                        help='图片边长（像素）(默认: 64)')
+    parser.add_argument('--sections', type=int, default=20,
+                        help='每个页面的章节数 (默认: 20)')
+    parser.add_argument('--article-images', type=int, default=20,
+                        help='知乎和 SegmentFault 文章中的图片数 (默认: 20)')
+    parser.add_argument('--listing-size', type=int, default=45,
+                        help='知乎专栏和作者文章列表的条目数 (默认: 45)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8000, help='监听端口，0表示自动分配 (默认: 8000)')
+    add_server_arguments(parser)
+    options = parser.parse_args()
+    options.latency /= 1000
+    
+    server = create_server(options, port=options.port)
+    # 第一行输出服务地址，供基准测试脚本读取
+    print(f'http://127.0.0.1:{server.server_address[1]}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,19 +6,1874 @@ import hashlib
 import time
 import re
 import argparse
+import threading
+import shutil
+import socket
+import sqlite3
+import json
+import importlib.util
+import itertools
+import asyncio
+import codecs
+import heapq
+import random
+import cProfile
+import pstats
+import tracemalloc
+import tarfile
+import zipfile
+import html
+import abc
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 from urllib.parse import urljoin, urlparse
-from bs4 import BeautifulSoup, Comment
-from markdownify import markdownify
-from PIL import Image
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.compat import chardet
+from requests.utils import get_encoding_from_headers
+from bs4 import BeautifulSoup, Comment, Doctype, NavigableString, Tag
+from markdownify import MarkdownConverter, html_heading_re
+from PIL import Image, ImageOps
 from io import BytesIO
 
+# BeautifulSoup 解析器，按解析速度从快到慢排列；html.parser 为标准库自带
+PARSER_BACKENDS = ('lxml', 'html.parser', 'html5lib')
+
+
+def available_parsers():
+    """返回当前环境中已安装的解析器，按解析速度从快到慢排列"""
+    return [name for name in PARSER_BACKENDS
+            if name == 'html.parser' or importlib.util.find_spec(name) is not None]
+
+
+def resolve_parser(parser='auto'):
+    """确定要使用的解析器
+    
+    Args:
+        parser (str): 解析器名称；为 auto 时选择已安装的最快解析器
+        
+    Raises:
+        ValueError: 指定的解析器不存在或未安装
+    """
+    installed = available_parsers()
+    if parser == 'auto':
+        return installed[0]
+    if parser not in PARSER_BACKENDS:
+        raise ValueError(f"不支持的解析器: {parser}，可选: {', '.join(PARSER_BACKENDS)}")
+    if parser not in installed:
+        raise ValueError(f"解析器 {parser} 未安装，请先执行 pip install {parser}")
+    return parser
+
+
+# 图片文件头与扩展名的对应关系
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+    (b'BM', '.bmp'),
+    (b'II*\x00', '.tif'),
+    (b'MM\x00*', '.tif'),
+    (b'\x00\x00\x01\x00', '.ico'),
+)
+# 延迟下载时可以直接采用的URL扩展名
+KNOWN_IMAGE_EXTS = {ext for _, ext in IMAGE_SIGNATURES} | {'.webp', '.avif', '.svg'}
+
+
+def sniff_image_type(head):
+    """根据文件开头的字节识别图片格式，返回扩展名，无法识别时返回None"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    if head[4:12] in (b'ftypavif', b'ftypavis'):
+        return '.avif'
+    for signature, ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    text = head.lstrip()[:5].lower()
+    if text.startswith((b'<svg', b'<?xml')):
+        return '.svg'
+    return None
+
+
+def image_ext_from_content_type(content_type):
+    """根据内容类型确定扩展名"""
+    if 'image/jpeg' in content_type or 'image/jpg' in content_type:
+        return '.jpg'
+    elif 'image/png' in content_type:
+        return '.png'
+    elif 'image/gif' in content_type:
+        return '.gif'
+    elif 'image/webp' in content_type:
+        return '.webp'
+    return None
+
+
+def convert_image(data, image_format):
+    """用Pillow解码图片并转换为指定格式，返回转换后的字节
+    
+    定义为模块级函数，以便在进程池中执行。
+    """
+    img = Image.open(BytesIO(data))
+    if image_format == 'PNG':
+        img = img.convert('RGBA')
+    elif image_format == 'JPEG' and img.mode not in ('L', 'RGB'):
+        # JPEG 不支持透明通道，透明部分填充为白色
+        rgba = img.convert('RGBA')
+        img = Image.new('RGB', rgba.size, 'white')
+        img.paste(rgba, mask=rgba.getchannel('A'))
+    output = BytesIO()
+    img.save(output, image_format)
+    return output.getvalue()
+
+
+# 图片优化可选的输出格式 -> (Pillow 格式名, 扩展名)
+OPTIMIZE_FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp'),
+    'avif': ('AVIF', '.avif'),
+    'png': ('PNG', '.png'),
+}
+# 可以解码并重新编码的图片扩展名 -> 不指定输出格式时使用的格式（静态GIF转为PNG）
+OPTIMIZABLE_EXTS = {
+    '.jpg': 'jpeg', '.png': 'png', '.webp': 'webp', '.avif': 'avif', '.gif': 'png', '.bmp': 'png', '.tif': 'png',
+}
+
+
+def avif_supported():
+    """检查Pillow能否编码AVIF；Pillow 11.2 之前的版本需要安装 pillow-avif-plugin"""
+    Image.init()
+    if 'AVIF' not in Image.SAVE and importlib.util.find_spec('pillow_avif'):
+        import pillow_avif  # noqa: F401  导入时向Pillow注册AVIF编解码器
+    return 'AVIF' in Image.SAVE
+
+
+def optimize_image(data, ext, max_width=0, max_height=0, image_format=None, quality=85):
+    """缩小并重新压缩图片，去除EXIF信息，返回 (图片字节, 扩展名)
+    
+    定义为模块级函数，以便在进程池中执行。GIF 等多帧动画原样返回；
+    格式不变、没有EXIF且重新编码后反而更大时也返回原始数据。
+    
+    Args:
+        data (bytes): 原始图片数据
+        ext (str): 原始图片的扩展名，见 OPTIMIZABLE_EXTS
+        max_width (int): 最大宽度，0 表示不限制，按比例缩小
+        max_height (int): 最大高度，0 表示不限制
+        image_format (str): 输出格式，见 OPTIMIZE_FORMATS；为空时保持原格式
+        quality (int): JPEG、WebP、AVIF 的压缩质量，1~100
+    """
+    if '.avif' in (ext, OPTIMIZE_FORMATS.get(image_format, ('', ''))[1]):
+        avif_supported()
+    img = Image.open(BytesIO(data))
+    if getattr(img, 'n_frames', 1) > 1:
+        return data, ext
+    has_exif = 'exif' in img.info
+    
+    # 按EXIF方向旋转后再丢弃EXIF，保留ICC配置文件以免颜色偏差
+    img = ImageOps.exif_transpose(img)
+    img.info.pop('exif', None)
+    icc_profile = img.info.get('icc_profile')
+    size = img.size
+    if max_width or max_height:
+        img.thumbnail((max_width or img.width, max_height or img.height), Image.LANCZOS)
+    
+    pillow_format, new_ext = OPTIMIZE_FORMATS[image_format or OPTIMIZABLE_EXTS[ext]]
+    if pillow_format == 'PNG':
+        if img.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        options = {'optimize': True}
+    else:
+        if pillow_format == 'JPEG' and img.mode in ('RGBA', 'LA', 'P', 'PA'):
+            # JPEG 不支持透明通道，透明部分填充为白色
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, 'white')
+            img.paste(rgba, mask=rgba.getchannel('A'))
+        elif img.mode not in ('L', 'RGB', 'RGBA') or (pillow_format == 'JPEG' and img.mode == 'RGBA'):
+            transparent = img.mode.endswith('A') or 'transparency' in img.info
+            img = img.convert('RGBA' if transparent else 'RGB')
+        options = {'quality': quality}
+        if pillow_format == 'JPEG':
+            options.update(optimize=True, progressive=True)
+        elif pillow_format == 'WEBP':
+            options['method'] = 6
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    
+    output = BytesIO()
+    img.save(output, pillow_format, **options)
+    result = output.getvalue()
+    if new_ext == ext and not has_exif and img.size == size and len(result) >= len(data):
+        return data, ext
+    return result, new_ext
+
+
+def temp_path(path, suffix='.part'):
+    """返回与 path 同目录的临时文件名，包含主机名、进程号和线程号，共享存储上的多台机器同时写入也不会冲突"""
+    return f'{path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}{suffix}'
+
+
+def read_file(path):
+    """读取整个文件的内容"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def write_file(path, chunks):
+    """将数据分块写入临时文件后重命名，避免留下写了一半的文件"""
+    tmp_path = temp_path(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_new_file(paths, chunks):
+    """将数据写入候选路径中第一个可用的路径，不覆盖已有文件
+    
+    数据先写入临时文件，再硬链接到目标路径。目标已存在时链接会失败，
+    因此多个进程（包括共享存储上的其他机器）同时写入同一路径时只有一个成功，
+    其余进程换下一个候选路径。文件系统不支持硬链接时，先以独占方式创建
+    目标文件占住路径，再用临时文件替换。
+    
+    Args:
+        paths (iterable): 候选路径，按顺序尝试
+        chunks (iterable): 数据块
+        
+    Returns:
+        str: 实际写入的路径
+    """
+    paths = iter(paths)
+    path = next(paths)
+    tmp_path = temp_path(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        while True:
+            try:
+                os.link(tmp_path, path)
+                return path
+            except FileExistsError:
+                pass
+            except OSError:
+                try:
+                    os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+                    os.replace(tmp_path, path)
+                    return path
+                except FileExistsError:
+                    pass
+            path = next(paths)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# 网页和图片的默认大小上限（字节），0 表示不限制
+DEFAULT_MAX_PAGE_SIZE = 20 * 1024 * 1024
+DEFAULT_MAX_IMAGE_SIZE = 50 * 1024 * 1024
+# 识别网页编码时最多检查的开头字节数
+CHARSET_SNIFF_SIZE = 64 * 1024
+
+BOM_ENCODINGS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# 浏览器将这些中文编码统一按 GB18030 解码
+ENCODING_ALIASES = {'gb2312': 'gb18030', 'gbk': 'gb18030', 'x-gbk': 'gb18030'}
+
+CONTENT_TYPE_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.I)
+META_CHARSET_RE = re.compile(rb'<meta[^>]+?charset\s*=\s*["\']?\s*([\w.:-]+)', re.I)
+
+
+class ResponseTooLarge(Exception):
+    """响应内容超过大小上限"""
+
+
+class NotModified(Exception):
+    """同步模式下，服务器确认文章自上次转换后没有变化"""
+
+
+def normalize_encoding(name):
+    """校验编码名称，返回Python可用的编码名，无法识别时返回None"""
+    if not name:
+        return None
+    name = ENCODING_ALIASES.get(name.lower(), name)
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def detect_html_encoding(content_type, head):
+    """确定网页编码
+    
+    依次使用 BOM、Content-Type 中声明的 charset、<meta> 中声明的 charset，
+    都没有时才对开头部分做编码检测，避免对整个文档运行检测。
+    
+    Args:
+        content_type (str): 响应的内容类型
+        head (bytes): 网页开头部分（最多 CHARSET_SNIFF_SIZE 字节）
+        
+    Returns:
+        str: 编码名称
+    """
+    for bom, encoding in BOM_ENCODINGS:
+        if head.startswith(bom):
+            return encoding
+    
+    match = CONTENT_TYPE_CHARSET_RE.search(content_type or '')
+    encoding = normalize_encoding(match.group(1)) if match else None
+    if encoding:
+        return encoding
+    
+    match = META_CHARSET_RE.search(head)
+    encoding = normalize_encoding(match.group(1).decode('ascii', 'ignore')) if match else None
+    if encoding:
+        return encoding
+    
+    return normalize_encoding(chardet.detect(head[:CHARSET_SNIFF_SIZE])['encoding']) or 'utf-8'
+
+
+def check_content_length(response, max_size):
+    """响应头声明的长度超过上限时抛出 ResponseTooLarge"""
+    length = response.headers.get('content-length', '')
+    if max_size and length.isdigit() and int(length) > max_size:
+        raise ResponseTooLarge(f"内容大小 {int(length)} 字节超过上限 {max_size} 字节: {response.url}")
+
+
+def limit_chunks(chunks, max_size, url=''):
+    """逐块传递数据，累计大小超过上限时抛出 ResponseTooLarge"""
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        if max_size and total > max_size:
+            raise ResponseTooLarge(f"内容大小超过上限 {max_size} 字节: {url}")
+        yield chunk
+
+
+def count_body_bytes(stats, response, size):
+    """统计响应内容的字节数：来自HTTP缓存的计入 bytes_cached，只有经网络传输的才计入 bytes_downloaded"""
+    cached = response.headers.get('X-Web2md-Cache') == 'hit'
+    stats.add('bytes_cached' if cached else 'bytes_downloaded', size)
+
+
+def read_html(response, max_size=DEFAULT_MAX_PAGE_SIZE, stats=None):
+    """流式读取网页内容并增量解码
+    
+    Args:
+        response (requests.Response): 以 stream=True 发送的请求的响应
+        max_size (int): 网页大小上限（字节），0 表示不限制
+        stats (ConversionStats): 可选，用于统计下载（或从缓存读取）的字节数
+        
+    Returns:
+        str: 解码后的网页内容
+        
+    Raises:
+        ResponseTooLarge: 网页超过大小上限
+    """
+    try:
+        check_content_length(response, max_size)
+        chunks = limit_chunks(response.iter_content(64 * 1024), max_size, response.url)
+        
+        # 只缓冲开头部分用于识别编码，其余部分边读取边解码
+        head = b''
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= CHARSET_SNIFF_SIZE:
+                break
+        
+        encoding = detect_html_encoding(response.headers.get('content-type'), head)
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        parts = [decoder.decode(head)]
+        size = len(head)
+        for chunk in chunks:
+            size += len(chunk)
+            parts.append(decoder.decode(chunk))
+        parts.append(decoder.decode(b'', final=True))
+        if stats:
+            count_body_bytes(stats, response, size)
+        return ''.join(parts)
+    finally:
+        response.close()
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'web2md')
+
+
+class HTTPCache:
+    """磁盘HTTP缓存
+    
+    保存带有 ETag / Last-Modified 校验信息的响应内容，再次请求时发送条件请求，
+    服务器返回304时直接使用缓存内容。缓存总大小超过上限时按最近访问时间淘汰。
+    
+    每个URL对应两个文件：<key>.json 保存响应头和校验信息，<key>.body 保存响应内容。
+    """
+    
+    # 不随缓存内容保存的响应头；缓存的是解压后的内容，Content-Length 按实际保存的大小重新记录
+    SKIP_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding',
+                    'connection', 'keep-alive', 'set-cookie'}
+    
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_size=1024 * 1024 * 1024):
+        self.root = root
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._size = None
+        os.makedirs(root, exist_ok=True)
+    
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        base = os.path.join(self.root, key[:2], key)
+        return base + '.json', base + '.body'
+    
+    def get(self, url):
+        """读取缓存条目，返回 (元数据, 内容文件路径)，不存在时返回None"""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if not os.path.exists(body_path):
+                return None
+            # 更新访问时间，用于LRU淘汰
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        return meta, body_path
+    
+    @staticmethod
+    def conditional_headers(meta):
+        """根据缓存的校验信息生成条件请求头"""
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+    
+    @staticmethod
+    def is_cacheable(response):
+        """只缓存带校验信息且未禁止保存的成功响应"""
+        if response.status_code != 200:
+            return False
+        if 'no-store' in response.headers.get('Cache-Control', '').lower():
+            return False
+        return bool(response.headers.get('ETag') or response.headers.get('Last-Modified'))
+    
+    def store(self, url, headers, chunks, max_size=0):
+        """保存响应内容，返回 (元数据, 内容文件路径)
+        
+        Args:
+            url (str): 请求URL
+            headers (dict): 响应头
+            chunks (iterable): 已解压的响应内容分块，逐块写入磁盘
+            max_size (int): 内容大小上限（字节），0 表示不限制
+            
+        Raises:
+            ResponseTooLarge: 内容超过大小上限，已写入的临时文件会被删除
+        """
+        meta_path, body_path = self._paths(url)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        
+        size = 0
+        try:
+            with open(body_path + suffix, 'wb') as f:
+                for chunk in limit_chunks(chunks, max_size, url):
+                    f.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            if os.path.exists(body_path + suffix):
+                os.remove(body_path + suffix)
+            raise
+        
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'headers': {k: v for k, v in headers.items() if k.lower() not in self.SKIP_HEADERS},
+            'stored_at': time.time(),
+        }
+        meta['headers']['Content-Length'] = str(size)
+        with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        
+        os.replace(body_path + suffix, body_path)
+        os.replace(meta_path + suffix, meta_path)
+        self._add_size(size + os.path.getsize(meta_path))
+        return meta, body_path
+    
+    def _add_size(self, size):
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += size
+            if self._size > self.max_size:
+                self._evict()
+    
+    def _entries(self):
+        """列出所有缓存条目：(最近访问时间, 大小, 元数据路径, 内容路径)"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith('.json'):
+                    continue
+                meta_path = os.path.join(dirpath, name)
+                body_path = meta_path[:-len('.json')] + '.body'
+                try:
+                    size = os.path.getsize(meta_path) + os.path.getsize(body_path)
+                    entries.append((os.path.getmtime(meta_path), size, meta_path, body_path))
+                except OSError:
+                    continue
+        return entries
+    
+    def _disk_usage(self):
+        return sum(entry[1] for entry in self._entries())
+    
+    def _evict(self):
+        """按最近访问时间淘汰缓存，直到总大小降到上限的90%以下"""
+        entries = sorted(self._entries())
+        total = sum(entry[1] for entry in entries)
+        target = self.max_size * 0.9
+        for _, size, meta_path, body_path in entries:
+            if total <= target:
+                break
+            for path in (meta_path, body_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+        self._size = total
+
+
+class _CachedBody:
+    """以文件形式提供缓存内容的响应体，兼容 Response.raw 的读取接口"""
+    
+    def __init__(self, path, original_response=None):
+        self._file = open(path, 'rb')
+        # Session 通过该属性从原始响应中提取Cookie
+        self._original_response = original_response
+    
+    def read(self, amt=None):
+        return self._file.read(-1 if amt is None else amt)
+    
+    def close(self):
+        self._file.close()
+    
+    def release_conn(self):
+        self.close()
+
+
+class CachingAdapter(HTTPAdapter):
+    """在会话层实现HTTP缓存的传输适配器
+    
+    对GET请求自动附加条件请求头；服务器返回304时以缓存内容构造200响应，
+    并在响应头中以 X-Web2md-Cache 标记缓存命中。
+    
+    写入缓存时会读完整个响应，调用方对内容大小的检查来不及生效，因此大小上限
+    通过请求头 X-Web2md-Max-Size 传给适配器（发送前去掉）：声明的长度超过上限时
+    不缓存，原样返回响应；写入过程中超过上限时删除临时文件并抛出 ResponseTooLarge。
+    """
+    
+    MAX_SIZE_HEADER = 'X-Web2md-Max-Size'
+    
+    def __init__(self, cache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+    
+    def send(self, request, stream=False, **kwargs):
+        max_size = int(request.headers.pop(self.MAX_SIZE_HEADER, 0) or 0)
+        # 调用方自行发送条件请求时不介入
+        if (request.method != 'GET' or 'If-None-Match' in request.headers
+                or 'If-Modified-Since' in request.headers):
+            return super().send(request, stream=stream, **kwargs)
+        
+        entry = self.cache.get(request.url)
+        if entry:
+            request.headers.update(HTTPCache.conditional_headers(entry[0]))
+        
+        response = super().send(request, stream=True, **kwargs)
+        
+        if entry and response.status_code == 304:
+            original = response.raw._original_response
+            response.close()
+            meta, body_path = entry
+            return self._build_response(request, meta, body_path, stream, original, 'hit')
+        
+        length = response.headers.get('content-length', '')
+        too_large = max_size and length.isdigit() and int(length) > max_size
+        if HTTPCache.is_cacheable(response) and not too_large:
+            original = response.raw._original_response
+            try:
+                meta, body_path = self.cache.store(
+                    request.url, response.headers,
+                    response.raw.stream(64 * 1024, decode_content=True), max_size)
+            finally:
+                response.close()
+            return self._build_response(request, meta, body_path, stream, original, 'miss')
+        
+        if not stream:
+            response.content
+        return response
+    
+    def _build_response(self, request, meta, body_path, stream, original, cache_status):
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        response.headers['X-Web2md-Cache'] = cache_status
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _CachedBody(body_path, original)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        if not stream:
+            try:
+                response.content
+            finally:
+                response.raw.close()
+        return response
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 响应头，返回需要等待的秒数，无法解析时返回None"""
+    value = (value or '').strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    """按主机限速的令牌桶，同时记录各主机的退避截止时间
+    
+    每个主机使用独立的令牌桶，rate 为每秒请求数，burst 为桶容量，rate 为0表示不限速。
+    可以通过 configure() 为某个域名（含子域名）单独设置限速。
+    
+    reserve() 预约一次请求并返回需要等待的秒数，由调用方决定如何等待
+    （线程中 time.sleep，事件循环中 asyncio.sleep，或由调度器延后提交），
+    因此同一个限速器可以在线程池、异步引擎和批量转换的多篇文章之间共享。
+    """
+    
+    # 值得重试的响应状态码
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+    
+    def __init__(self, rate=0, burst=1, max_backoff=60):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_backoff = max_backoff
+        self._profiles = {}
+        # 主机 -> [剩余令牌数, 更新时间, 退避截止时间]
+        self._buckets = {}
+        self._lock = threading.Lock()
+    
+    def configure(self, domain, rate, burst=1):
+        """为域名及其子域名设置限速"""
+        with self._lock:
+            self._profiles[domain.lower()] = (rate, max(1, burst))
+    
+    def configure_default(self, domain, rate, burst=1):
+        """设置站点的默认限速，不覆盖已经通过 configure() 设置的限速"""
+        with self._lock:
+            self._profiles.setdefault(domain.lower(), (rate, max(1, burst)))
+    
+    def _limits(self, host):
+        while host:
+            if host in self._profiles:
+                return self._profiles[host]
+            host = host.partition('.')[2]
+        return self.rate, self.burst
+    
+    def _bucket(self, host, now):
+        if host not in self._buckets:
+            self._buckets[host] = [self._limits(host)[1], now, 0.0]
+        return self._buckets[host]
+    
+    def reserve(self, url):
+        """预约一次对 url 所在主机的请求
+        
+        Returns:
+            float: 发送请求前需要等待的秒数
+        """
+        host = urlparse(url).hostname or ''
+        now = time.monotonic()
+        with self._lock:
+            rate, burst = self._limits(host)
+            bucket = self._bucket(host, now)
+            wait_time = bucket[2] - now
+            if rate:
+                # 令牌数可以为负，表示已经预约到未来的请求
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate) - 1
+                bucket[1] = now
+                if bucket[0] < 0:
+                    wait_time = max(wait_time, -bucket[0] / rate)
+            return max(0.0, wait_time)
+    
+    def blocked_for(self, url):
+        """返回该主机剩余的退避时间（秒）"""
+        host = urlparse(url).hostname or ''
+        with self._lock:
+            bucket = self._buckets.get(host)
+            return max(0.0, bucket[2] - time.monotonic()) if bucket else 0.0
+    
+    def backoff(self, url, delay):
+        """在 delay 秒内暂停向该主机发送请求，其他主机不受影响"""
+        host = urlparse(url).hostname or ''
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(host, now)
+            bucket[2] = max(bucket[2], now + delay)
+    
+    def retry_delay(self, attempt, response=None):
+        """计算重试前的等待时间
+        
+        响应带有 Retry-After 时按其等待，否则使用带随机抖动的指数退避，
+        最长不超过 max_backoff 秒。
+        """
+        if response is not None:
+            delay = parse_retry_after(response.headers.get('retry-after'))
+            if delay is not None:
+                return min(delay, self.max_backoff)
+        return random.uniform(0.5, 1.0) * min(self.max_backoff, 2 ** attempt)
+
+
+class AsyncFetcher:
+    """基于 httpx 的异步抓取引擎
+    
+    在后台线程中运行一个事件循环，页面和图片请求都在同一个循环中执行。
+    每个主机的并发请求数受 per_host_limit 限制，安装了 h2 时启用 HTTP/2。
+    同步代码通过 run() / get() 提交请求，因此 convert() 等同步接口保持不变。
+    
+    返回的响应会转换为 requests.Response，与 requests 引擎的处理逻辑通用。
+    """
+    
+    # 由 httpx 自行管理、HTTP/2 中不允许出现的请求头
+    SKIP_HEADERS = {'connection', 'keep-alive', 'host'}
+    
+    def __init__(self, per_host_limit=8, http_cache=None, timeout=30):
+        try:
+            import httpx
+        except ImportError:
+            raise ValueError("异步引擎需要安装 httpx，请先执行 pip install 'httpx[http2]'")
+        self._httpx = httpx
+        self.per_host_limit = per_host_limit
+        self.http_cache = http_cache
+        self.timeout = timeout
+        self.http2 = importlib.util.find_spec('h2') is not None
+        self._client = None
+        self._host_limits = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='web2md-async', daemon=True)
+        self._thread.start()
+    
+    def run(self, coro):
+        """在事件循环中执行协程并等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+    
+    def get(self, url, headers=None, timeout=None, max_size=0):
+        """同步发送GET请求，返回 requests.Response"""
+        return self.run(self.fetch(url, headers, timeout, max_size=max_size))
+    
+    def _host_limit(self, url):
+        host = urlparse(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[host]
+    
+    async def fetch(self, url, headers=None, timeout=None, before_send=None, max_size=0):
+        """异步发送GET请求，返回 requests.Response
+        
+        响应内容以流的方式读取，响应头声明的长度或已读取的数据超过 max_size 时立即停止，
+        不会把过大的响应整个读入内存。
+        
+        Args:
+            before_send: 可选的协程函数，取得主机并发名额之后、发送请求之前等待它完成，
+                用于在排队期间主机开始退避时推迟发送
+            max_size (int): 响应内容大小上限（字节），0 表示不限制
+        
+        Raises:
+            requests.exceptions.Timeout: 请求超时
+            requests.exceptions.ConnectionError: 网络错误
+            ResponseTooLarge: 响应内容超过大小上限
+        """
+        if self._client is None:
+            self._client = self._httpx.AsyncClient(
+                http2=self.http2, follow_redirects=True,
+                limits=self._httpx.Limits(max_connections=None, max_keepalive_connections=100))
+        
+        headers = {k: v for k, v in (headers or {}).items() if k.lower() not in self.SKIP_HEADERS}
+        # 调用方自行发送条件请求时不使用缓存
+        conditional = any(k.lower() in ('if-none-match', 'if-modified-since') for k in headers)
+        # 缓存读写都是磁盘操作，放到线程池中，避免阻塞事件循环
+        loop = asyncio.get_running_loop()
+        entry = None
+        if self.http_cache and not conditional:
+            entry = await loop.run_in_executor(None, self.http_cache.get, url)
+        if entry:
+            headers.update(HTTPCache.conditional_headers(entry[0]))
+        
+        try:
+            async with self._host_limit(url):
+                if before_send is not None:
+                    await before_send()
+                async with self._client.stream('GET', url, headers=headers,
+                                               timeout=timeout or self.timeout) as response:
+                    check_content_length(response, max_size)
+                    chunks = []
+                    size = 0
+                    body = response.aiter_bytes()
+                    try:
+                        async for chunk in body:
+                            size += len(chunk)
+                            if max_size and size > max_size:
+                                raise ResponseTooLarge(f"内容大小超过上限 {max_size} 字节: {url}")
+                            chunks.append(chunk)
+                    finally:
+                        # 提前停止读取时立即关闭生成器，不留到事件循环停止后才被回收
+                        await body.aclose()
+        except self._httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e))
+        except self._httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        
+        result = requests.Response()
+        result.status_code = response.status_code
+        result.reason = response.reason_phrase
+        result.url = str(response.url)
+        result.headers = CaseInsensitiveDict(
+            (k, v) for k, v in response.headers.items() if k.lower() != 'content-encoding')
+        result._content = b''.join(chunks)
+        result._content_consumed = True
+        
+        if entry and response.status_code == 304:
+            meta, body_path = entry
+            result.status_code = 200
+            result.reason = 'OK'
+            result.headers = CaseInsensitiveDict(meta['headers'])
+            result.headers['X-Web2md-Cache'] = 'hit'
+            # 缓存条目记录了实际大小，超过上限时不读取
+            check_content_length(result, max_size)
+            result._content = await loop.run_in_executor(None, read_file, body_path)
+        elif self.http_cache and not conditional and HTTPCache.is_cacheable(result):
+            await loop.run_in_executor(None, self.http_cache.store, url, result.headers, [result._content])
+            result.headers['X-Web2md-Cache'] = 'miss'
+        
+        result.encoding = get_encoding_from_headers(result.headers)
+        return result
+    
+    def close(self):
+        """关闭客户端并停止事件循环"""
+        if self._client is not None:
+            self.run(self._client.aclose())
+        # 结束提前停止读取的响应留下的异步生成器
+        self.run(self._loop.shutdown_asyncgens())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def create_session(pool_size=10, http_cache=None):
+    """创建带连接池的requests会话
+    
+    Args:
+        pool_size (int): 每个主机保持的最大连接数，应不小于并发请求数
+        http_cache (HTTPCache): 可选的磁盘HTTP缓存
+    """
+    session = requests.Session()
+    # 连接池大小需覆盖并发请求数，否则多余的连接会被丢弃
+    if http_cache:
+        adapter = CachingAdapter(http_cache, pool_maxsize=pool_size)
+    else:
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class SessionPool:
+    """按文章主机复用requests会话，使同一站点的文章共享连接池和Cookie"""
+    
+    def __init__(self, pool_size=10, http_cache=None):
+        self.pool_size = pool_size
+        self.http_cache = http_cache
+        self._sessions = {}
+        self._lock = threading.Lock()
+    
+    def get(self, url):
+        """获取URL所属主机的会话，不存在时创建"""
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._sessions:
+                self._sessions[host] = create_session(self.pool_size, self.http_cache)
+            return self._sessions[host]
+    
+    def close(self):
+        """关闭所有会话"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+class ImageStore:
+    """按内容哈希保存图片的共享存储
+    
+    图片按内容的SHA-256哈希保存在 objects/ 目录下，并以URL建立索引。
+    已知URL的图片无需再次下载；内容相同的图片只保存一份，文章目录中的
+    图片以硬链接指向存储中的文件。
+    """
+    
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, 'index.sqlite3'),
+                                   timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS images ('
+                             'url TEXT PRIMARY KEY, digest TEXT NOT NULL, ext TEXT NOT NULL)')
+    
+    def _blob_path(self, digest, ext):
+        return os.path.join(self.root, 'objects', digest[:2], digest + ext)
+    
+    def lookup(self, url):
+        """返回URL对应的存储文件路径，未知URL或文件已丢失时返回None"""
+        with self._lock:
+            row = self._db.execute('SELECT digest, ext FROM images WHERE url = ?', (url,)).fetchone()
+        if row:
+            blob_path = self._blob_path(*row)
+            if os.path.exists(blob_path):
+                return blob_path
+        return None
+    
+    def add(self, url, path):
+        """将已保存的图片加入存储并记录URL索引
+        
+        Args:
+            url (str): 图片URL
+            path (str): 已保存到本地的图片路径
+            
+        Returns:
+            str: 图片应被引用的路径。通常为原路径（已硬链接到存储文件），
+                无法建立硬链接且存储中已有相同内容时返回存储文件路径
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        ext = os.path.splitext(path)[1]
+        blob_path = self._blob_path(digest, ext)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        
+        if os.path.exists(blob_path):
+            # 存储中已有相同内容，用硬链接替换刚写入的副本
+            if not os.path.samefile(blob_path, path):
+                tmp_path = temp_path(path, '.tmp')
+                try:
+                    os.link(blob_path, tmp_path)
+                    os.replace(tmp_path, path)
+                except OSError:
+                    os.remove(path)
+                    path = blob_path
+        else:
+            try:
+                os.link(path, blob_path)
+            except FileExistsError:
+                pass
+            except OSError:
+                # 跨文件系统等无法硬链接的情况，复制一份到存储中
+                tmp_path = temp_path(blob_path, '.tmp')
+                shutil.copyfile(path, tmp_path)
+                os.replace(tmp_path, blob_path)
+        
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO images (url, digest, ext) VALUES (?, ?, ?)',
+                             (url, digest, ext))
+        return path
+    
+    def close(self):
+        self._db.close()
+
+
+# 归档输出支持的扩展名，按输出文件名判断
+ARCHIVE_SUFFIXES = ('.zip', '.epub', '.tar', '.tar.gz', '.tgz', '.tar.zst')
+# 已经压缩过的图片格式在zip中直接存储，不再压缩
+STORED_EXTS = {'.jpg', '.png', '.gif', '.webp', '.avif'}
+IMAGE_MEDIA_TYPES = {
+    '.jpg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif', '.webp': 'image/webp',
+    '.avif': 'image/avif', '.svg': 'image/svg+xml', '.bmp': 'image/bmp', '.tif': 'image/tiff',
+    '.ico': 'image/vnd.microsoft.icon',
+}
+# XML 1.0 不允许出现的控制字符
+XML_INVALID_CHARS_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def archive_suffix(path):
+    """返回输出文件对应的归档扩展名，不是归档时返回None"""
+    lower = path.lower()
+    for suffix in ARCHIVE_SUFFIXES:
+        if lower.endswith(suffix):
+            return suffix
+    return None
+
+
+class ArchiveWriter(abc.ABC):
+    """将图片和Markdown逐个写入单个归档文件
+    
+    图片下载完成后立即写入归档，不在磁盘上保存单独的文件；多个下载线程
+    通过锁依次写入。Markdown在所有图片之后写入，其中的图片链接是相对于
+    归档根目录的路径，与普通输出的目录结构一致。
+    
+    子类必须实现 _write() 和 close()，缺少任何一个时创建实例就会失败，
+    不会在写入归档的中途才出错。
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._names = set()
+        self._lock = threading.Lock()
+    
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._names
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def add(self, name, data):
+        """写入一个文件，name 为归档中使用 / 分隔的相对路径"""
+        with self._lock:
+            self._write(name, data)
+            self._names.add(name)
+    
+    def add_article(self, name, markdown, document, title, url):
+        """写入转换结果
+        
+        Args:
+            name (str): Markdown文件在归档中的名称
+            markdown (str): Markdown内容
+            document (BeautifulSoup): 图片链接已替换为本地路径的文档树
+            title (str): 文章标题
+            url (str): 文章URL
+        """
+        self.add(name, markdown.encode('utf-8'))
+    
+    @abc.abstractmethod
+    def _write(self, name, data):
+        """将一个文件写入归档，调用时已持有锁"""
+    
+    @abc.abstractmethod
+    def close(self):
+        """完成写入并关闭归档文件"""
+
+
+class ZipArchiveWriter(ArchiveWriter):
+    """zip归档，图片直接存储，文本使用deflate压缩"""
+    
+    def __init__(self, path):
+        super().__init__(path)
+        self._zip = zipfile.ZipFile(path, 'w')
+    
+    def _write(self, name, data):
+        ext = os.path.splitext(name)[1].lower()
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED if ext in STORED_EXTS or name == 'mimetype' else zipfile.ZIP_DEFLATED
+        self._zip.writestr(info, data)
+    
+    def close(self):
+        self._zip.close()
+
+
+class TarArchiveWriter(ArchiveWriter):
+    """tar归档，以流模式写入，可使用gzip或zstd压缩（zstd需要安装 zstandard）"""
+    
+    def __init__(self, path, compression=None):
+        super().__init__(path)
+        self._file = open(path, 'wb')
+        self._stream = self._file
+        try:
+            if compression == 'zst':
+                try:
+                    import zstandard
+                except ImportError:
+                    raise ValueError("输出 .tar.zst 需要安装 zstandard，请先执行 pip install zstandard")
+                self._stream = zstandard.ZstdCompressor().stream_writer(self._file)
+                compression = None
+            self._tar = tarfile.open(fileobj=self._stream, mode=f'w|{compression or ""}')
+        except BaseException:
+            self._file.close()
+            raise
+    
+    def _write(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0o644
+        self._tar.addfile(info, BytesIO(data))
+    
+    def close(self):
+        self._tar.close()
+        if self._stream is not self._file:
+            self._stream.close()
+        self._file.close()
+
+
+class EpubArchiveWriter(ZipArchiveWriter):
+    """EPUB 3 电子书：文章保存为一个XHTML章节，图片与普通输出的目录结构相同"""
+    
+    CONTAINER = ('<?xml version="1.0" encoding="utf-8"?>\n'
+                 '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+                 '  <rootfiles>\n'
+                 '    <rootfile full-path="content.opf" media-type="application/oebps-package+xml"/>\n'
+                 '  </rootfiles>\n'
+                 '</container>\n')
+    XHTML = ('<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+             '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="zh">\n'
+             '<head><meta charset="utf-8"/><title>{title}</title></head>\n<body>\n{body}\n</body>\n</html>\n')
+    PACKAGE = ('<?xml version="1.0" encoding="utf-8"?>\n'
+               '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="uid">\n'
+               '  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+               '    <dc:identifier id="uid">{identifier}</dc:identifier>\n'
+               '    <dc:title>{title}</dc:title>\n'
+               '    <dc:language>zh</dc:language>\n'
+               '    <meta property="dcterms:modified">{modified}</meta>\n'
+               '  </metadata>\n'
+               '  <manifest>\n'
+               '    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>\n'
+               '    <item id="article" href="article.xhtml" media-type="application/xhtml+xml"/>\n'
+               '{items}'
+               '  </manifest>\n'
+               '  <spine><itemref idref="article"/></spine>\n'
+               '</package>\n')
+    
+    def __init__(self, path):
+        super().__init__(path)
+        # mimetype 必须是第一个文件且不压缩
+        self.add('mimetype', b'application/epub+zip')
+    
+    def add_article(self, name, markdown, document, title, url):
+        container = document.body or document.find('html') or document
+        body = ''.join(str(node) for node in container.contents if not isinstance(node, Doctype))
+        title = html.escape(title)
+        with self._lock:
+            images = sorted(self._names - {'mimetype'})
+        items = ''.join(
+            f'    <item id="img{i}" href="{html.escape(image)}" '
+            f'media-type="{IMAGE_MEDIA_TYPES.get(os.path.splitext(image)[1].lower(), "application/octet-stream")}"/>\n'
+            for i, image in enumerate(images, 1))
+        
+        self.add('META-INF/container.xml', self.CONTAINER.encode('utf-8'))
+        self.add('article.xhtml', self.XHTML.format(
+            title=title, body=XML_INVALID_CHARS_RE.sub('', body)).encode('utf-8'))
+        self.add('nav.xhtml', self.XHTML.format(
+            title=title, body=f'<nav epub:type="toc"><ol><li><a href="article.xhtml">{title}</a></li></ol></nav>'
+        ).encode('utf-8'))
+        self.add('content.opf', self.PACKAGE.format(
+            identifier=html.escape(url or title), title=title, items=items,
+            modified=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())).encode('utf-8'))
+
+
+def open_archive(path, suffix):
+    """按扩展名创建归档写入器"""
+    if suffix == '.zip':
+        return ZipArchiveWriter(path)
+    if suffix == '.epub':
+        return EpubArchiveWriter(path)
+    compression = {'.tar.gz': 'gz', '.tgz': 'gz', '.tar.zst': 'zst'}.get(suffix)
+    return TarArchiveWriter(path, compression)
+
+
+# 待下载图片列表的默认文件名，位于当前目录中；隐藏文件，不会随图片目录一起发布
+PENDING_FILE = '.web2md-pending.sqlite3'
+# 旧版本放在图片目录中的待下载图片列表
+LEGACY_PENDING_FILE = 'pending.sqlite3'
+
+
+class PendingImages:
+    """延迟下载的图片列表，保存在SQLite数据库中
+    
+    延迟下载图片时，转换过程只为图片分配本地路径并写入Markdown，
+    图片URL和路径记录在列表中，由 fetch-images 子命令稍后下载。
+    图片保存成功后才从列表中删除，中断后重新运行会从未完成的图片继续；
+    多个进程可以同时读写同一个列表。转换时的图片处理参数随图片一起记录，
+    保证下载后的格式与Markdown中已写入的扩展名一致。
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS pending ('
+                             'path TEXT PRIMARY KEY, url TEXT NOT NULL, article_url TEXT NOT NULL, '
+                             'options TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, added REAL NOT NULL)')
+    
+    def add(self, article_url, images, options):
+        """记录一篇文章中待下载的图片
+        
+        Args:
+            article_url (str): 文章URL，下载图片时按文章所属站点设置请求头
+            images (list): (图片URL, 本地路径) 列表
+            options (dict): 下载时传给 Web2Markdown 的图片处理参数
+        """
+        now = time.time()
+        options = json.dumps(options, sort_keys=True)
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO pending (path, url, article_url, options, added) '
+                                 'VALUES (?, ?, ?, ?, ?)',
+                                 [(os.path.abspath(path), url, article_url, options, now) for url, path in images])
+    
+    def articles(self, max_attempts=0):
+        """按文章分组返回待下载的图片
+        
+        Args:
+            max_attempts (int): 跳过已经失败这么多次的图片，0 表示不跳过
+            
+        Returns:
+            list: (文章URL, 图片处理参数, [(图片URL, 本地路径), ...]) 列表，按加入列表的顺序排列
+        """
+        query = 'SELECT article_url, options, url, path FROM pending'
+        params = ()
+        if max_attempts:
+            query += ' WHERE attempts < ?'
+            params = (max_attempts,)
+        with self._lock:
+            rows = self._db.execute(query + ' ORDER BY added, path', params).fetchall()
+        articles = {}
+        for article_url, options, url, path in rows:
+            articles.setdefault((article_url, options), []).append((url, path))
+        return [(article_url, json.loads(options), images) for (article_url, options), images in articles.items()]
+    
+    def done(self, path):
+        """图片已保存，从列表中删除"""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM pending WHERE path = ?', (path,))
+    
+    def failed(self, path):
+        """记录一次下载失败，图片保留在列表中"""
+        with self._lock, self._db:
+            self._db.execute('UPDATE pending SET attempts = attempts + 1 WHERE path = ?', (path,))
+    
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+    
+    def close(self):
+        self._db.close()
+
+
+class JobQueue:
+    """多台机器共享的转换任务队列，保存在SQLite数据库中
+    
+    任务以URL为键。工作进程领取任务时获得一段时间的租约，转换期间定期续约；
+    进程崩溃或失去联系后租约过期，任务会被其他进程重新领取。转换失败的任务
+    按指数退避延后重试，超过最大尝试次数后标记为失败。领取和状态更新都在
+    BEGIN IMMEDIATE 事务中完成，同一任务不会同时被两个进程领取。
+    
+    数据库默认使用WAL日志模式，读写互不阻塞；WAL依赖共享内存，只能在同一台
+    机器的进程间共享。队列文件放在NFS等网络文件系统上、由多台机器访问时，
+    应使用 journal_mode='delete'。
+    """
+    
+    STATES = ('pending', 'running', 'done', 'failed')
+    
+    def __init__(self, path, lease=300, max_attempts=3, retry_delay=30, max_retry_delay=3600,
+                 journal_mode='wal'):
+        """
+        Args:
+            path (str): 队列数据库文件
+            lease (float): 租约时长（秒），超过这么久没有续约的任务会被重新领取
+            max_attempts (int): 每个任务最多尝试的次数
+            retry_delay (float): 第一次失败后的重试间隔（秒），之后每次加倍
+            max_retry_delay (float): 重试间隔的上限（秒）
+            journal_mode (str): SQLite日志模式，wal 或 delete
+        """
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # 事务由 _transaction 显式控制
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._db.execute(f'PRAGMA journal_mode={journal_mode}')
+        with self._transaction():
+            self._db.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                             'url TEXT PRIMARY KEY, output TEXT NOT NULL, '
+                             "state TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                             'owner TEXT, lease_until REAL, not_before REAL NOT NULL DEFAULT 0, '
+                             'error TEXT, result TEXT, added REAL NOT NULL, updated REAL NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, not_before)')
+    
+    @contextmanager
+    def _transaction(self):
+        """在写事务中执行，立即获取写锁，避免两个进程读到同一个待领取的任务"""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+    
+    def add(self, entries):
+        """加入任务
+        
+        已在队列中的URL：等待或正在执行的任务保持不变；已完成或失败的任务
+        更新输出路径并重新排队。
+        
+        Args:
+            entries (list): (url, output) 列表
+            
+        Returns:
+            int: 新加入或重新排队的任务数
+        """
+        now = time.time()
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany("INSERT INTO jobs (url, output, added, updated) VALUES (?, ?, ?, ?) "
+                           "ON CONFLICT (url) DO UPDATE SET output = excluded.output, state = 'pending', "
+                           'attempts = 0, not_before = 0, error = NULL, result = NULL, updated = excluded.updated '
+                           "WHERE state IN ('done', 'failed')",
+                           [(url, output, now, now) for url, output in entries])
+            return db.total_changes - before
+    
+    def claim(self, owner):
+        """领取一个可执行的任务：等待中且已到重试时间的任务，或租约已过期的任务
+        
+        租约过期且已用完尝试次数的任务直接标记为失败。
+        
+        Args:
+            owner (str): 领取者标识，续约和提交结果时校验
+            
+        Returns:
+            tuple: (url, output, 第几次尝试)，没有可执行的任务时返回None
+        """
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("UPDATE jobs SET state = 'failed', owner = NULL, lease_until = NULL, updated = ?, "
+                       "error = '租约过期：执行任务的进程可能已退出' "
+                       "WHERE state = 'running' AND lease_until < ? AND attempts >= ?",
+                       (now, now, self.max_attempts))
+            row = db.execute("SELECT url, output, attempts FROM jobs "
+                             "WHERE (state = 'pending' AND not_before <= ?) OR (state = 'running' AND lease_until < ?) "
+                             'ORDER BY not_before, added LIMIT 1', (now, now)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET state = 'running', owner = ?, lease_until = ?, attempts = attempts + 1, "
+                       'updated = ? WHERE url = ?', (owner, now + self.lease, now, row[0]))
+        return row[0], row[1], row[2] + 1
+    
+    def heartbeat(self, url, owner):
+        """续约，返回租约是否仍属于 owner"""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE jobs SET lease_until = ?, updated = ? "
+                                "WHERE url = ? AND owner = ? AND state = 'running'",
+                                (now + self.lease, now, url, owner))
+            return cursor.rowcount == 1
+    
+    def complete(self, url, owner, result):
+        """记录转换成功及其统计，返回租约是否仍属于 owner（租约已被他人接管时不更新）"""
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE jobs SET state = 'done', owner = NULL, lease_until = NULL, error = NULL, "
+                                "result = ?, updated = ? WHERE url = ? AND owner = ? AND state = 'running'",
+                                (json.dumps(result, ensure_ascii=False), time.time(), url, owner))
+            return cursor.rowcount == 1
+    
+    def fail(self, url, owner, error):
+        """记录一次失败：未用完尝试次数时按指数退避重新排队，否则标记为失败
+        
+        Returns:
+            bool: 任务是否会重试
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT attempts FROM jobs WHERE url = ? AND owner = ? AND state = 'running'",
+                             (url, owner)).fetchone()
+            if row is None:
+                return False
+            attempts = row[0]
+            retry = attempts < self.max_attempts
+            # 带随机抖动，避免多台机器同时重试
+            delay = random.uniform(0.5, 1.0) * min(self.max_retry_delay, self.retry_delay * 2 ** (attempts - 1))
+            db.execute('UPDATE jobs SET state = ?, owner = NULL, lease_until = NULL, not_before = ?, error = ?, '
+                       'updated = ? WHERE url = ?',
+                       ('pending' if retry else 'failed', now + delay if retry else 0, error, now, url))
+            return retry
+    
+    def next_wakeup(self):
+        """返回距离下一个任务可以领取还有多少秒；没有等待或正在执行的任务时返回None"""
+        with self._lock:
+            row = self._db.execute("SELECT MIN(CASE state WHEN 'pending' THEN not_before ELSE lease_until END) "
+                                   "FROM jobs WHERE state IN ('pending', 'running')").fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+    
+    def counts(self):
+        """返回各状态的任务数"""
+        with self._lock:
+            rows = self._db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        counts = dict.fromkeys(self.STATES, 0)
+        counts.update(rows)
+        return counts
+    
+    def failures(self):
+        """返回失败任务的 (url, output, 尝试次数, 错误信息) 列表"""
+        with self._lock:
+            return self._db.execute("SELECT url, output, attempts, error FROM jobs WHERE state = 'failed' "
+                                    'ORDER BY updated').fetchall()
+    
+    def close(self):
+        self._db.close()
+
+
+# 常见网站的正文CSS选择器，按域名（含子域名）匹配，依次尝试
+SITE_SELECTORS = {
+    'juejin.cn': ['.article-content', '.markdown-body'],
+    'jianshu.com': ['article'],
+    'csdn.net': ['#content_views', '.blog-content-box'],
+    'cnblogs.com': ['#cnblogs_post_body', '.post'],
+    'oschina.net': ['.article-detail', '.content'],
+    'infoq.cn': ['.article-preview', '.article-content'],
+    'github.com': ['article.markdown-body', '.markdown-body'],
+    'medium.com': ['article'],
+    'mp.weixin.qq.com': ['#js_content'],
+}
+
+# 用于正文评分的 class / id 特征
+POSITIVE_HINTS_RE = re.compile(r'article|body|content|entry|main|page|post|text|blog|story|markdown', re.I)
+NEGATIVE_HINTS_RE = re.compile(
+    r'comment|meta|footer|footnote|sidebar|side|nav|menu|banner|share|related|recommend|widget|'
+    r'header|ad-|ads|sponsor|popup|login|toolbar|breadcrumb', re.I)
+# 参与评分的段落标签，以及候选容器的基础分
+PARAGRAPH_TAGS = ('p', 'pre', 'td', 'blockquote')
+TAG_SCORES = {'article': 10, 'main': 10, 'div': 5, 'section': 3, 'pre': 3, 'td': 3, 'blockquote': 3,
+              'form': -3, 'ol': -3, 'ul': -3, 'dl': -3, 'li': -3, 'aside': -10, 'nav': -10,
+              'header': -5, 'footer': -10}
+# 正文文本少于该字符数时认为识别失败，保留整个页面
+MIN_CONTENT_LENGTH = 250
+
+
+def selectors_for_url(url, selectors=SITE_SELECTORS):
+    """返回与URL域名匹配的正文选择器列表"""
+    host = (urlparse(url).hostname or '').lower()
+    while host:
+        if host in selectors:
+            return list(selectors[host])
+        host = host.partition('.')[2]
+    return []
+
+
+def _class_weight(tag):
+    hints = ' '.join(tag.get('class', [])) + ' ' + (tag.get('id') or '')
+    weight = 0
+    if POSITIVE_HINTS_RE.search(hints):
+        weight += 25
+    if NEGATIVE_HINTS_RE.search(hints):
+        weight -= 25
+    return weight
+
+
+def find_main_content(soup, selectors=()):
+    """找到页面中的正文容器
+    
+    先依次尝试CSS选择器；都没有匹配时按 readability 的思路评分：每个足够长的段落
+    给父元素加分、给祖父元素加一半分，再结合标签类型、class/id 特征和链接密度，
+    选出得分最高的容器。文本长度和链接文本长度自底向上一次计算，耗时与节点数成正比。
+    
+    Args:
+        soup (BeautifulSoup): 文档树
+        selectors (list): 优先使用的CSS选择器
+        
+    Returns:
+        Tag: 正文容器；无法可靠识别时返回None
+    """
+    for selector in selectors:
+        node = soup.select_one(selector)
+        if node is not None:
+            return node
+    
+    tags = soup.find_all()
+    # 自底向上计算每个标签的文本长度和其中链接文本的长度
+    text_length, link_length = {}, {}
+    for tag in reversed(tags):
+        text = links = 0
+        if tag.name not in ('script', 'style', 'noscript', 'template'):
+            for child in tag.children:
+                if isinstance(child, Tag):
+                    text += text_length[id(child)]
+                    links += link_length[id(child)]
+                elif type(child) is NavigableString:
+                    text += len(child.strip())
+        text_length[id(tag)] = text
+        link_length[id(tag)] = text if tag.name == 'a' else links
+    
+    scores = {}
+    candidates = {}
+    
+    def add_score(tag, score):
+        if tag is None or not isinstance(tag, Tag) or tag.name in ('html', '[document]'):
+            return
+        if id(tag) not in scores:
+            scores[id(tag)] = TAG_SCORES.get(tag.name, 0) + _class_weight(tag)
+            candidates[id(tag)] = tag
+        scores[id(tag)] += score
+    
+    for tag in tags:
+        if tag.name not in PARAGRAPH_TAGS or text_length[id(tag)] < 25:
+            continue
+        text = tag.get_text()
+        score = 1 + text.count(',') + text.count('，') + min(text_length[id(tag)] // 100, 3)
+        add_score(tag.parent, score)
+        add_score(tag.parent.parent if tag.parent else None, score / 2)
+    
+    best, best_score = None, 0
+    for key, tag in candidates.items():
+        length = text_length[key]
+        link_density = link_length[key] / length if length else 1
+        score = scores[key] * (1 - link_density)
+        if score > best_score:
+            best, best_score = tag, score
+    
+    if best is None or best.name == 'body' or text_length[id(best)] < MIN_CONTENT_LENGTH:
+        return None
+    return best
+
+
+# 代码块 class 中的语言标记，如 language-python、lang-js
+CODE_LANGUAGE_RE = re.compile(r'^(?:language|lang)-([\w+#.-]+)$')
+# 代码高亮库使用的、不表示语言的 class
+NON_LANGUAGE_CLASSES = frozenset((
+    'hljs', 'highlight', 'highlighted', 'prettyprint', 'prettyprinted', 'linenums', 'line-numbers',
+    'code', 'source', 'sourcecode', 'syntax', 'nohighlight', 'plaintext', 'wrap', 'copyable',
+))
+BACKTICK_RUN_RE = re.compile(r'`+')
+# markdownify 中需要去掉空白文本节点的嵌套元素
+NESTED_TAGS = frozenset(('ol', 'ul', 'li', 'table', 'thead', 'tbody', 'tfoot', 'tr', 'td', 'th'))
+TABLE_SECTIONS = ('thead', 'tbody', 'tfoot')
+
+
+def code_language(pre):
+    """从 class 中识别代码语言，识别不到时返回空字符串
+    
+    只认 <pre> 或 <code> 上的 language-xxx、lang-xxx，以及 highlight.js 旧版本在 <code>
+    上的写法 class="hljs xxx"；其他 class（如 prettyprint linenums）大多不是语言名。
+    """
+    code = pre.find('code', recursive=False)
+    for tag in (pre, code):
+        if tag is None:
+            continue
+        for name in tag.get('class') or []:
+            match = CODE_LANGUAGE_RE.match(name)
+            if match:
+                return match.group(1).lower()
+    
+    classes = (code.get('class') or []) if code is not None else []
+    if 'hljs' in classes:
+        for name in classes[classes.index('hljs') + 1:]:
+            if name.lower() not in NON_LANGUAGE_CLASSES and re.fullmatch(r'[A-Za-z][\w+#]*', name):
+                return name.lower()
+    return ''
+
+
+class FastMarkdownConverter(MarkdownConverter):
+    """针对代码块和大表格优化的 markdownify 转换器
+    
+    markdownify 对每个节点递归转换并逐个拼接字符串，代码块中的每段高亮 <span> 都会
+    经过空白折叠和转义，既慢又可能改坏代码。这里：
+    
+    - <pre> 不再递归转换子节点，直接取原始文本放进围栏代码块，语言取自 class；
+    - 表格逐行逐格收集到列表中，最后一次拼接；
+    - 其余节点的子节点转换结果也改为列表拼接，输出与 markdownify 相同。
+    """
+    
+    def process_tag(self, node, convert_as_inline, children_only=False):
+        if not children_only and node.name in ('pre', 'table') and self.should_convert_tag(node.name):
+            if node.name == 'pre':
+                return self.pre_to_markdown(node, convert_as_inline)
+            return self.table_to_markdown(node)
+        
+        # 标题和表格单元格中不能包含块级元素
+        convert_children_as_inline = convert_as_inline
+        if not children_only and (node.name in ('td', 'th') or html_heading_re.match(node.name)):
+            convert_children_as_inline = True
+        
+        if node.name in NESTED_TAGS:
+            self._strip_nested_whitespace(node)
+        
+        parts = []
+        for child in node.children:
+            if isinstance(child, (Comment, Doctype)):
+                continue
+            if isinstance(child, NavigableString):
+                parts.append(self.process_text(child))
+            else:
+                parts.append(self.process_tag(child, convert_children_as_inline))
+        text = ''.join(parts)
+        
+        if not children_only:
+            convert_fn = getattr(self, 'convert_%s' % node.name, None)
+            if convert_fn and self.should_convert_tag(node.name):
+                text = convert_fn(node, text, convert_as_inline)
+        return text
+
+    @staticmethod
+    def _strip_nested_whitespace(node):
+        """去掉列表、表格等嵌套元素开头、结尾和相邻子元素之间的空白文本节点"""
+        for child in list(node.children):
+            if type(child) is not NavigableString or child.strip():
+                continue
+            previous, following = child.previous_sibling, child.next_sibling
+            if (previous is None or following is None
+                    or getattr(previous, 'name', None) in NESTED_TAGS
+                    or getattr(following, 'name', None) in NESTED_TAGS):
+                child.extract()
+
+    def pre_to_markdown(self, el, convert_as_inline=False):
+        """将 <pre> 的原始文本原样放入围栏代码块
+        
+        Args:
+            el (Tag): <pre> 元素
+            convert_as_inline (bool): 位于标题或表格单元格中时输出为行内代码
+            
+        Returns:
+            str: Markdown代码块
+        """
+        parts = []
+        for node in el.descendants:
+            if isinstance(node, NavigableString):
+                if not isinstance(node, Comment):
+                    parts.append(str(node))
+            elif node.name == 'br':
+                parts.append('\n')
+        code = ''.join(parts)
+        # HTML规定紧跟 <pre> 的换行应被忽略，html.parser 不会处理，这里统一去掉
+        if code.startswith('\n'):
+            code = code[1:]
+        code = code.rstrip('\n')
+        if not code.strip():
+            return ''
+        
+        # 围栏比代码中最长的连续反引号多一个
+        longest = max((len(run) for run in BACKTICK_RUN_RE.findall(code)), default=0)
+        if convert_as_inline:
+            fence = '`' * (longest + 1)
+            code = ' '.join(code.split())
+            padding = ' ' if code.startswith('`') or code.endswith('`') else ''
+            return f'{fence}{padding}{code}{padding}{fence}'
+        fence = '`' * max(3, longest + 1)
+        language = code_language(el) or self.options['code_language']
+        return f'\n{fence}{language}\n{code}\n{fence}\n'
+
+    def table_to_markdown(self, el):
+        """逐行收集单元格后一次拼接成Markdown表格
+        
+        第一行全部是 <th> 时作为表头，否则补一个空表头。单元格中的换行替换为空格，
+        竖线转义，避免破坏表格结构。<caption> 作为表格前的一个段落输出。
+        
+        Args:
+            el (Tag): <table> 元素
+            
+        Returns:
+            str: Markdown表格
+        """
+        rows = []
+        captions = []
+        for child in el.children:
+            if child.name == 'caption':
+                captions.append(' '.join(self.process_tag(child, True, children_only=True).split()))
+            elif child.name == 'tr':
+                rows.append(child)
+            elif child.name in TABLE_SECTIONS:
+                rows.extend(tr for tr in child.children if tr.name == 'tr')
+        
+        lines = []
+        for index, tr in enumerate(rows):
+            cells = [cell for cell in tr.children if cell.name in ('td', 'th')]
+            if not cells:
+                continue
+            texts = [self.process_tag(cell, True, children_only=True).replace('\n', ' ').replace('|', '\\|')
+                     for cell in cells]
+            if not lines and not all(cell.name == 'th' for cell in cells):
+                lines.append('| ' + ' | '.join([''] * len(cells)) + ' |')
+                lines.append('| ' + ' | '.join(['---'] * len(cells)) + ' |')
+            lines.append('| ' + ' | '.join(texts) + ' |')
+            if len(lines) == 1:
+                lines.append('| ' + ' | '.join(['---'] * len(cells)) + ' |')
+        table = '\n'.join(lines)
+        caption = ' '.join(text for text in captions if text)
+        if caption:
+            table = f'{caption}\n\n{table}' if table else caption
+        if not table:
+            return ''
+        return '\n\n' + table + '\n\n'
+
+
+class ConversionStats:
+    """单次转换的耗时和计数统计
+    
+    timings 记录各阶段的累计耗时（秒），counters 记录字节数、请求数、重试次数等。
+    计数可以在下载图片的工作线程中并发更新。
+    """
+    
+    TIMERS = ('fetch', 'parse', 'extract', 'clean_html', 'images', 'markdownify', 'total')
+    COUNTERS = ('requests', 'bytes_downloaded', 'cache_hits', 'bytes_cached', 'retries', 'images_downloaded',
+                'images_from_store', 'images_reused', 'images_removed', 'images_skipped', 'images_failed',
+                'images_optimized', 'image_bytes_saved', 'images_deferred')
+    
+    # 文本格式输出时使用的名称
+    LABELS = {
+        'fetch': '获取网页', 'parse': '解析HTML', 'extract': '提取正文', 'clean_html': '清理HTML', 'images': '下载图片',
+        'markdownify': '转换Markdown', 'total': '总计',
+        'requests': '请求数', 'bytes_downloaded': '下载字节数', 'cache_hits': '缓存命中', 'bytes_cached': '缓存字节数',
+        'retries': '重试次数', 'images_downloaded': '下载图片', 'images_from_store': '复用存储图片',
+        'images_reused': '复用已有图片', 'images_removed': '删除多余图片',
+        'images_skipped': '跳过图片', 'images_failed': '失败图片',
+        'images_optimized': '优化图片', 'image_bytes_saved': '优化节省字节数', 'images_deferred': '延迟下载图片',
+    }
+    
+    def __init__(self, url=None, output_file=None):
+        self.url = url
+        self.output_file = output_file
+        self.timings = dict.fromkeys(self.TIMERS, 0.0)
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        # 同步模式下文章没有变化、未重新转换时为True
+        self.unchanged = False
+        self._lock = threading.Lock()
+    
+    def __getstate__(self):
+        # 锁不能序列化，统计从工作进程返回时去掉
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def timer(self, name):
+        """累计 with 代码块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.timings[name] += elapsed
+    
+    def add(self, name, value=1):
+        """增加计数"""
+        with self._lock:
+            self.counters[name] += value
+    
+    def as_dict(self):
+        return {
+            'url': self.url,
+            'output_file': self.output_file,
+            'unchanged': self.unchanged,
+            'timings': {name: round(value, 4) for name, value in self.timings.items()},
+            'counters': dict(self.counters),
+        }
+    
+    def format(self):
+        """格式化为便于阅读的文本"""
+        timings = '，'.join(f"{self.LABELS[name]} {value:.3f}秒" for name, value in self.timings.items())
+        counters = '，'.join(f"{self.LABELS[name]} {value}" for name, value in self.counters.items())
+        return f"耗时: {timings}\n计数: {counters}"
+
+
 class Web2Markdown:
-    def __init__(self, url, output_file, image_dir='i'):
+    # 知乎文章接口地址，{} 替换为文章ID；基准测试时可替换为本地服务器
+    ZHIHU_API = 'https://www.zhihu.com/api/v4/articles/{}'
+    # 知乎专栏和作者的文章列表接口，{} 替换为专栏ID或用户标识，分页由接口返回的 next 地址给出
+    ZHIHU_COLUMN_API = 'https://www.zhihu.com/api/v4/columns/{}/items?limit=20&offset=0'
+    ZHIHU_MEMBER_API = 'https://www.zhihu.com/api/v4/members/{}/articles?limit=20&offset=0'
+    ZHIHU_ARTICLE_URL = 'https://zhuanlan.zhihu.com/p/{}'
+    
+    def __init__(self, url, output_file, image_dir='i', image_workers=8, session=None,
+                 image_store=None, http_cache=None, parser='auto', convert_webp=True,
+                 convert_pool=None, fetcher=None, max_page_size=DEFAULT_MAX_PAGE_SIZE,
+                 max_image_size=DEFAULT_MAX_IMAGE_SIZE, rate_limiter=None, max_retries=3,
+                 quiet=False, extract=True, content_selectors=None, site_selectors=None, sync=False,
+                 image_optimization=None, pending_images=None):
         self.url = url
         self.output_file = output_file
         self.image_dir = image_dir
         self.image_count = 0
-        self.session = requests.Session()
+        # 图片序号在下载前按文档顺序分配，保证文件名与完成顺序无关
+        self._image_index = 0
+        self._image_lock = threading.Lock()
+        # 已下载图片的URL到本地路径映射，避免同一图片重复下载
+        self._image_paths = {}
+        self.image_workers = max(1, image_workers)
+        # 批量转换时由外部传入共享会话，复用连接池
+        self.session = session or create_session(self.image_workers, http_cache)
+        # 可选的共享图片存储（ImageStore），用于跨文章、跨运行去重
+        self.image_store = image_store
+        # HTML解析器，auto 表示自动选择已安装的最快解析器
+        self.parser = resolve_parser(parser)
+        # 是否将WebP图片转换为PNG；转换可交给进程池执行，避免占用GIL
+        self.convert_webp = convert_webp
+        self.convert_pool = convert_pool
+        # 图片优化参数（optimize_image 的关键字参数），为空时不优化
+        self.image_optimization = image_optimization
+        # 延迟下载图片时的待下载列表（PendingImages），为空时在转换过程中下载图片
+        self.pending_images = pending_images
+        # 下载延迟图片时，图片URL到转换时已分配的本地路径的映射
+        self._reserved_paths = {}
+        # 可选的异步抓取引擎（AsyncFetcher），为空时使用 requests 会话
+        self.fetcher = fetcher
+        # 网页和图片的大小上限（字节），0 表示不限制
+        self.max_page_size = max_page_size
+        self.max_image_size = max_image_size
+        # 按主机限速和退避的调度器，批量转换时由外部传入共享实例
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max(1, max_retries)
+        # quiet 为True时不输出处理过程日志，只输出错误信息
+        self.quiet = quiet
+        self.stats = ConversionStats(url, output_file)
+        # 普通网站是否只保留正文；content_selectors 优先于按域名配置的 site_selectors
+        self.extract = extract
+        self.content_selectors = list(content_selectors or []) + selectors_for_url(
+            url, {**SITE_SELECTORS, **(site_selectors or {})})
+        # 同步模式：根据上次转换的清单跳过未变化的文章、复用已下载的图片
+        self.sync = sync
+        self.manifest_path = f'{output_file}.manifest.json'
+        self._manifest = {}
+        self._source = {}
+        # 输出文件名为 .zip、.epub、.tar.zst 等时，将Markdown和图片写入单个归档文件
+        self.archive_suffix = archive_suffix(output_file) if output_file else None
+        self.archive = None
+        self._document = None
+        if self.archive_suffix:
+            # 归档中的图片目录与Markdown文件位于同一层，图片链接与普通输出一致
+            self.image_dir = os.path.join(os.path.dirname(output_file),
+                                          os.path.basename(os.path.normpath(image_dir)))
         
         # 基础请求头
         self.headers = {
@@ -52,6 +1907,12 @@ class Web2Markdown:
                 'sec-fetch-mode': 'no-cors',
                 'sec-fetch-site': 'cross-site',
             }
+            
+            # 知乎接口和图片CDN的限速（每秒请求数, 突发请求数）
+            self.rate_limits = {
+                'zhihu.com': (2, 4),
+                'zhimg.com': (10, 20),
+            }
         elif 'segmentfault.com' in url:
             # SegmentFault 需要特定的请求头来模拟浏览器行为
             self.headers.update({
@@ -85,8 +1946,130 @@ class Web2Markdown:
                 'sec-fetch-mode': 'no-cors',  # 无CORS请求
                 'sec-fetch-site': 'cross-site',  # 跨站请求
             }
+            
+            # SegmentFault 页面和图片的限速（每秒请求数, 突发请求数）
+            self.rate_limits = {
+                'segmentfault.com': (2, 4),
+            }
         else:
             self.image_headers = self.headers
+            self.rate_limits = {}
+        
+        for domain, (rate, burst) in self.rate_limits.items():
+            self.rate_limiter.configure_default(domain, rate, burst)
+
+    def log(self, message):
+        """输出处理过程日志，quiet 模式下不输出"""
+        if not self.quiet:
+            print(message)
+
+    def _count_response(self, response):
+        """统计请求数和HTTP缓存命中数"""
+        self.stats.add('requests')
+        if response.headers.get('X-Web2md-Cache') == 'hit':
+            self.stats.add('cache_hits')
+
+    def _retry_later(self, url, delay):
+        """记录一次重试，并让该主机在 delay 秒内暂停请求"""
+        self.stats.add('retries')
+        self.rate_limiter.backoff(url, delay)
+
+    def _size_limit_headers(self, url, headers, max_size):
+        """使用HTTP缓存的会话在写入缓存时就要检查大小上限，通过请求头告诉 CachingAdapter"""
+        if max_size and isinstance(self.session.get_adapter(url), CachingAdapter):
+            headers = dict(headers, **{CachingAdapter.MAX_SIZE_HEADER: str(max_size)})
+        return headers
+
+    def _http_get(self, url, headers, timeout=None, stream=False, max_size=0):
+        """发送GET请求，根据配置使用 requests 会话或异步抓取引擎
+        
+        异步引擎总是读取完整的响应内容，stream 参数只对 requests 会话有效；
+        max_size 只对异步引擎有效，读取时超过上限立即抛出 ResponseTooLarge，
+        requests 会话由调用方在流式读取时检查。
+        """
+        time.sleep(self.rate_limiter.reserve(url))
+        if self.fetcher:
+            response = self.fetcher.get(url, headers, timeout, max_size)
+        else:
+            response = self.session.get(url, headers=headers, timeout=timeout, stream=stream)
+        self._count_response(response)
+        return response
+
+    def _get_source(self, url, timeout=30, stream=False):
+        """获取文章来源（网页或接口），并记录其校验信息
+        
+        同步模式下使用清单中保存的 ETag / Last-Modified 发送条件请求，
+        服务器返回304时抛出 NotModified。上次的输出文件或图片已被删除时
+        不发送条件请求，需要重新获取完整内容来重新生成它们。
+        """
+        headers = self.headers
+        if not self.fetcher:
+            headers = self._size_limit_headers(url, headers, self.max_page_size)
+        conditional = dict(headers)
+        previous = self._manifest.get('source', {})
+        if self.sync and previous.get('url') == url and self._outputs_intact():
+            if previous.get('etag'):
+                conditional['If-None-Match'] = previous['etag']
+            if previous.get('last_modified'):
+                conditional['If-Modified-Since'] = previous['last_modified']
+        
+        response = self._http_get(url, headers=conditional, timeout=timeout, stream=stream,
+                                  max_size=self.max_page_size)
+        if response.status_code == 304:
+            response.close()
+            if self._outputs_intact():
+                raise NotModified(url)
+            # 请求期间输出文件被删除，去掉条件请求头重新获取
+            response = self._http_get(url, headers=headers, timeout=timeout, stream=stream,
+                                      max_size=self.max_page_size)
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+        self._source = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        return response
+
+    def _record_source_text(self, text):
+        """记录文章来源内容的哈希值，用于判断文章是否变化"""
+        self._source['sha256'] = hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def fetch_html(self, url):
+        """流式获取网页并解码，超过 max_page_size 时抛出 ResponseTooLarge"""
+        with self.stats.timer('fetch'):
+            response = self._get_source(url, stream=True)
+            html = read_html(response, self.max_page_size, self.stats)
+            self._record_source_text(html)
+            return html
+
+    def extract_main_content(self, soup):
+        """只保留正文部分，减少后续清理和图片下载的工作量
+        
+        Args:
+            soup (BeautifulSoup): 整个页面的文档树
+            
+        Returns:
+            BeautifulSoup: 只包含正文的新文档树；无法识别正文时返回原文档树
+        """
+        content = find_main_content(soup, self.content_selectors)
+        if content is None:
+            self.log("未识别出正文区域，保留整个页面")
+            return soup
+        
+        self.log(f"提取正文区域: <{content.name}> {' '.join(content.get('class', []))}".rstrip())
+        article = BeautifulSoup('', self.parser)
+        # 正文外的第一个h1通常是文章标题，一并保留
+        if content.name != 'h1' and content.find('h1') is None:
+            title = soup.find('h1')
+            if title is not None:
+                article.append(title.extract())
+                article.append('\n')
+        article.append(content.extract())
+        return article
 
     def get_zhihu_content(self, url):
         """获取知乎文章内容"""
@@ -96,12 +2079,13 @@ class Web2Markdown:
             article_id = article_id.split('p/')[-1]
         
         # 构建API URL
-        api_url = f'https://www.zhihu.com/api/v4/articles/{article_id}'
+        api_url = self.ZHIHU_API.format(article_id)
         
         try:
-            response = self.session.get(api_url, headers=self.headers)
-            response.raise_for_status()
-            data = response.json()
+            with self.stats.timer('fetch'):
+                response = self._get_source(api_url)
+                count_body_bytes(self.stats, response, len(response.content))
+                data = response.json()
             
             # 提取文章内容
             title = data.get('title', '')
@@ -109,12 +2093,74 @@ class Web2Markdown:
             
             # 构建完整的HTML
             html = f'<h1>{title}</h1>{content}'
+            self._record_source_text(html)
             return html
             
+        except NotModified:
+            raise
         except Exception as e:
-            print(f"获取知乎文章内容失败: {str(e)}")
+            print(f"获取知乎文章内容失败: {str(e)}", file=sys.stderr)
             return None
 
+    @classmethod
+    def zhihu_listing_api(cls, url):
+        """根据知乎专栏或作者主页URL返回文章列表第一页的接口地址，不是列表页时返回None
+        
+        支持 zhuanlan.zhihu.com/<专栏>、www.zhihu.com/column/<专栏>、
+        www.zhihu.com/people/<用户> 和 www.zhihu.com/org/<机构>（可带 /posts）。
+        """
+        parsed = urlparse(url)
+        parts = [part for part in parsed.path.split('/') if part]
+        host = parsed.hostname or ''
+        if host == 'zhuanlan.zhihu.com' and len(parts) == 1 and parts[0] != 'p':
+            return cls.ZHIHU_COLUMN_API.format(parts[0])
+        if host.endswith('zhihu.com') and len(parts) >= 2:
+            if parts[0] == 'column':
+                return cls.ZHIHU_COLUMN_API.format(parts[1])
+            if parts[0] in ('people', 'org'):
+                return cls.ZHIHU_MEMBER_API.format(parts[1])
+        return None
+
+    def list_zhihu_articles(self, api_url):
+        """获取知乎专栏或作者文章列表的一页，使用知乎的请求头和限速
+        
+        Args:
+            api_url (str): 列表接口地址；第一页由 zhihu_listing_api() 给出，之后使用上一页返回的地址
+            
+        Returns:
+            tuple: (文章URL列表, 下一页接口地址)；已是最后一页时下一页地址为None
+        """
+        for attempt in range(self.max_retries):
+            try:
+                response = self._http_get(api_url, headers=self.headers, timeout=30)
+            except requests.exceptions.RequestException as e:
+                if attempt + 1 == self.max_retries:
+                    raise
+                self.log(f"请求异常: {str(e)}，稍后重试")
+                self._retry_later(api_url, self.rate_limiter.retry_delay(attempt))
+                continue
+            if response.status_code == 200:
+                break
+            if response.status_code not in RateLimiter.RETRY_STATUS or attempt + 1 == self.max_retries:
+                raise Exception(f"获取知乎文章列表失败: HTTP {response.status_code}")
+            self._retry_later(api_url, self._retry_after_status(response, attempt))
+        
+        count_body_bytes(self.stats, response, len(response.content))
+        data = response.json()
+        urls = []
+        for item in data.get('data') or []:
+            # 专栏中还可能收录回答、想法等，只导出文章
+            if item.get('type', 'article') != 'article':
+                self.log(f"跳过非文章内容: {item.get('type')} {item.get('id')}")
+                continue
+            urls.append(self.ZHIHU_ARTICLE_URL.format(item['id']))
+        
+        paging = data.get('paging') or {}
+        next_url = None
+        if data.get('data') and not paging.get('is_end', True) and paging.get('next'):
+            next_url = urljoin(api_url, paging['next'])
+        return urls, next_url
+
     def get_segmentfault_content(self, url):
         """获取 SegmentFault 文章内容
         
@@ -122,22 +2168,22 @@ class Web2Markdown:
             url (str): SegmentFault 文章的URL
             
         Returns:
-            str: 处理后的HTML内容，包含文章标题和正文
+            BeautifulSoup: 处理后的文档树，包含文章标题和正文
             None: 如果获取失败
             
         处理步骤：
         1. 发送GET请求获取页面内容
         2. 使用BeautifulSoup解析HTML
         3. 提取文章标题和正文内容
-        4. 组合成新的HTML字符串返回
+        4. 将标题和正文节点移入新的文档树返回，避免序列化后再次解析
         """
         try:
             # 发送请求获取页面内容
-            response = self.session.get(url, headers=self.headers, timeout=30)
-            response.raise_for_status()
+            html = self.fetch_html(url)
             
             # 使用BeautifulSoup解析页面
-            soup = BeautifulSoup(response.text, 'html.parser')
+            with self.stats.timer('parse'):
+                soup = BeautifulSoup(html, self.parser)
             
             # 获取文章标题（h1标签带class='h1'）
             title = soup.find('h1', class_='h1')
@@ -150,159 +2196,426 @@ class Web2Markdown:
             if not content:
                 raise Exception("无法找到文章内容，可能是页面结构已变化")
             
-            # 构建完整的HTML，确保标题和内容之间有适当的间隔
-            html = f'<h1>{title}</h1>\n{str(content)}'
-            return html
+            # 构建新的文档树，确保标题和内容之间有适当的间隔
+            article = BeautifulSoup('', self.parser)
+            heading = article.new_tag('h1')
+            heading.string = str(title)
+            article.append(heading)
+            article.append('\n')
+            article.append(content.extract())
+            return article
             
+        except NotModified:
+            raise
         except Exception as e:
-            print(f"获取 SegmentFault 文章内容失败: {str(e)}")
+            print(f"获取 SegmentFault 文章内容失败: {str(e)}", file=sys.stderr)
             return None
 
-    def download_image(self, img_url):
-        """下载图片并保存到本地"""
+    def _next_image_index(self):
+        """分配下一个图片序号"""
+        with self._image_lock:
+            self._image_index += 1
+            return self._image_index
+
+    def _markdown_path(self, path):
+        """将图片路径转换为相对于Markdown文件所在目录的链接路径"""
+        output_dir = os.path.dirname(os.path.abspath(self.output_file))
+        return os.path.relpath(path, output_dir).replace(os.sep, '/')
+
+    def _local_path(self, markdown_path):
+        """将Markdown中的图片链接路径还原为本地文件路径"""
+        output_dir = os.path.dirname(os.path.abspath(self.output_file))
+        return os.path.join(output_dir, *markdown_path.split('/'))
+
+    def _load_manifest(self):
+        """读取上次转换的清单，清单不存在、无法解析或URL不同时返回空字典"""
         try:
-            # 处理相对URL
-            if not img_url.startswith(('http://', 'https://')):
-                img_url = urljoin(self.url, img_url)
-            
-            # 处理特殊的图片URL（例如数据URL）
-            if img_url.startswith('data:'):
-                print(f"跳过数据URL: {img_url[:50]}...")
-                return None
-            
-            # 添加重试机制
-            max_retries = 3
-            for attempt in range(max_retries):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(manifest, dict) or manifest.get('url') != self.url:
+            return {}
+        return manifest
+
+    def _manifest_unchanged(self):
+        """判断文章内容与上次转换时相同，且输出文件和图片都还在"""
+        previous = self._manifest.get('source', {})
+        if not previous.get('sha256') or previous.get('sha256') != self._source.get('sha256'):
+            return False
+        return self._outputs_intact()
+
+    def _outputs_intact(self):
+        """判断上次转换的Markdown文件和清单中的图片都还在"""
+        if not os.path.exists(self.output_file):
+            return False
+        return all(os.path.exists(self._local_path(path)) for path in self._manifest.get('images', {}).values())
+
+    def _write_manifest(self, markdown_sha256):
+        """保存本次转换的清单：来源URL、校验信息、内容哈希以及图片URL到本地文件的映射"""
+        manifest = {
+            'version': 1,
+            'url': self.url,
+            'output_file': os.path.basename(self.output_file),
+            'source': self._source,
+            'markdown_sha256': markdown_sha256,
+            'images': self.image_manifest(),
+            'updated': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        }
+        data = json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')
+        write_file(self.manifest_path, [data])
+
+    def _remove_orphaned_images(self):
+        """删除上次转换下载、本次不再引用的图片，只删除图片目录中的文件"""
+        image_dir = os.path.realpath(self.image_dir)
+        current = set(self._image_paths.values())
+        for path in set(self._manifest.get('images', {}).values()) - current:
+            local_path = self._local_path(path)
+            if os.path.commonpath([image_dir, os.path.realpath(local_path)]) != image_dir:
+                continue
+            try:
+                os.remove(local_path)
+            except FileNotFoundError:
+                continue
+            self.stats.add('images_removed')
+            self.log(f"删除不再引用的图片: {local_path}")
+
+    def _image_path(self, img_url, index, ext):
+        """生成唯一的本地图片路径，延迟下载时使用已写入Markdown的路径"""
+        if img_url in self._reserved_paths:
+            return self._reserved_paths[img_url]
+        
+        # 如果文件已存在，换用带额外序号的文件名
+        for local_path in self._candidate_image_paths(img_url, index, ext):
+            if not self._image_exists(local_path):
+                return local_path
+
+    def _candidate_image_paths(self, img_url, index, ext):
+        """按顺序生成候选图片路径：image_序号_哈希.扩展名，之后依次添加额外的序号"""
+        # 使用URL的MD5哈希值和序号组合生成文件名
+        url_hash = hashlib.md5(img_url.encode()).hexdigest()[:8]
+        yield os.path.join(self.image_dir, f'image_{index}_{url_hash}{ext}')
+        for counter in itertools.count(1):
+            yield os.path.join(self.image_dir, f'image_{index}_{url_hash}_{counter}{ext}')
+
+    def _image_exists(self, local_path):
+        """归档输出时检查归档中是否已有该文件，否则检查磁盘"""
+        if self.archive:
+            return self._markdown_path(local_path) in self.archive
+        return os.path.exists(local_path)
+
+    def _write_image(self, local_path, chunks):
+        """保存图片数据；归档输出时写入归档而不是图片目录"""
+        if self.archive:
+            self.archive.add(self._markdown_path(local_path), b''.join(chunks))
+        else:
+            write_file(local_path, chunks)
+
+    def _store_image(self, img_url, index, ext, chunks):
+        """保存图片并返回本地路径
+        
+        归档输出和延迟下载（路径已写入Markdown）时写入确定的路径；否则以不覆盖的方式
+        写入第一个可用的候选路径，多个进程同时向同一图片目录写入时不会互相覆盖。
+        """
+        if self.archive or img_url in self._reserved_paths:
+            local_path = self._image_path(img_url, index, ext)
+            self._write_image(local_path, chunks)
+            return local_path
+        return write_new_file(self._candidate_image_paths(img_url, index, ext), chunks)
+
+    def _finish_image(self, img_url, local_path):
+        """记录已保存的图片，返回Markdown中使用的链接路径"""
+        with self._image_lock:
+            self.image_count += 1
+        if self.image_store and not self.archive:
+            local_path = self.image_store.add(img_url, local_path)
+        return self._markdown_path(local_path)
+
+    def _link_stored_image(self, img_url, index, blob_path):
+        """将图片存储中的文件硬链接到图片目录，无法链接时直接引用存储文件"""
+        if index is None:
+            index = self._next_image_index()
+        ext = os.path.splitext(blob_path)[1]
+        if self.archive:
+            local_path = self._image_path(img_url, index, ext)
+            with open(blob_path, 'rb') as f:
+                self._write_image(local_path, [f.read()])
+            with self._image_lock:
+                self.image_count += 1
+            return self._markdown_path(local_path)
+        
+        os.makedirs(self.image_dir, exist_ok=True)
+        if img_url in self._reserved_paths:
+            paths = [self._reserved_paths[img_url]]
+        else:
+            paths = self._candidate_image_paths(img_url, index, ext)
+        try:
+            # 链接在目标已存在时失败，其他进程同时占用了该路径时换下一个
+            for local_path in paths:
                 try:
-                    print(f"尝试下载图片 (尝试 {attempt + 1}/{max_retries}): {img_url}")
-                    
-                    # 使用特定的图片请求头
-                    response = self.session.get(img_url, headers=self.image_headers, timeout=30, stream=True)
-                    response.raise_for_status()
-                    
-                    if response.status_code == 200:
-                        try:
-                            # 确保资源目录存在
-                            os.makedirs(self.image_dir, exist_ok=True)
-                            
-                            # 获取内容类型
-                            content_type = response.headers.get('content-type', '').lower()
-                            print(f"图片内容类型: {content_type}")
-                            
-                            # 根据内容类型确定扩展名
-                            ext = None
-                            if 'image/jpeg' in content_type or 'image/jpg' in content_type:
-                                ext = '.jpg'
-                            elif 'image/png' in content_type:
-                                ext = '.png'
-                            elif 'image/gif' in content_type:
-                                ext = '.gif'
-                            elif 'image/webp' in content_type:
-                                ext = '.png'  # 将webp转换为png
-                            
-                            # 如果无法从内容类型确定扩展名，从URL获取
-                            if not ext:
-                                ext = os.path.splitext(urlparse(img_url).path)[1].lower()
-                                if not ext:
-                                    ext = '.jpg'  # 默认使用jpg
-                            
-                            # 生成唯一的图片文件名
-                            self.image_count += 1
-                            # 使用URL的MD5哈希值和序号组合生成文件名
-                            url_hash = hashlib.md5(img_url.encode()).hexdigest()[:8]
-                            local_filename = f'image_{self.image_count}_{url_hash}{ext}'
-                            local_path = os.path.join(self.image_dir, local_filename)
-                            
-                            # 如果文件已存在，添加额外的序号
-                            counter = 1
-                            while os.path.exists(local_path):
-                                local_filename = f'image_{self.image_count}_{url_hash}_{counter}{ext}'
-                                local_path = os.path.join(self.image_dir, local_filename)
-                                counter += 1
-                            
-                            # 保存图片
-                            img_data = response.content
-                            try:
-                                # 尝试打开图片以验证其有效性
-                                img = Image.open(BytesIO(img_data))
-                                
-                                # 如果是webp格式，转换为PNG
-                                if 'image/webp' in content_type:
-                                    img = img.convert('RGBA')
-                                
-                                # 保存图片
-                                img.save(local_path)
-                                print(f"图片保存成功: {local_path}")
-                                
-                                relative_path = os.path.join(self.image_dir, local_filename)
-                                return relative_path
-                                
-                            except Exception as e:
-                                print(f"图片处理失败: {str(e)}")
-                                # 尝试直接保存原始数据
-                                with open(local_path, 'wb') as f:
-                                    f.write(img_data)
-                                print(f"使用原始数据保存图片: {local_path}")
-                                relative_path = os.path.join(self.image_dir, local_filename)
-                                return relative_path
-                                
-                        except Exception as e:
-                            print(f"保存图片失败: {str(e)}")
-                            if attempt < max_retries - 1:
-                                continue
-                            
-                    elif response.status_code == 429:  # Too Many Requests
-                        print(f"请求过于频繁，等待后重试...")
-                        if attempt < max_retries - 1:
-                            time.sleep(2 ** attempt)  # 指数退避
-                            continue
-                    else:
-                        print(f"HTTP错误: {response.status_code}")
-                    break
-                    
-                except requests.exceptions.Timeout:
-                    print("请求超时，重试...")
-                    if attempt < max_retries - 1:
-                        time.sleep(2 ** attempt)
-                        continue
-                except requests.exceptions.RequestException as e:
-                    print(f"请求异常: {str(e)}")
-                    if attempt < max_retries - 1:
-                        time.sleep(2 ** attempt)
-                        continue
+                    os.link(blob_path, local_path)
                     break
+                except FileExistsError:
+                    if os.path.samefile(local_path, blob_path) or img_url in self._reserved_paths:
+                        break
+        except OSError:
+            local_path = blob_path
+        with self._image_lock:
+            self.image_count += 1
+        return self._markdown_path(local_path)
+
+    def _run_image_task(self, func, *args, **kwargs):
+        """执行图片转换或优化，配置了进程池时在子进程中执行"""
+        if self.convert_pool:
+            return self.convert_pool.submit(func, *args, **kwargs).result()
+        return func(*args, **kwargs)
+
+    def _process_image(self, data, ext, convert, reserved=None):
+        """用Pillow转换或优化图片，返回 (图片字节, 扩展名)，处理失败时使用原始数据
+        
+        Args:
+            data (bytes): 完整的图片数据
+            ext (str): 原始图片的扩展名
+            convert (bool): 是否需要将WebP转换为PNG
+            reserved (str): 延迟下载时已写入Markdown的本地路径，图片按其扩展名对应的格式保存
+        """
+        reserved_ext = os.path.splitext(reserved)[1] if reserved else None
+        reserved_format = next(
+            (name for name, (_, format_ext) in OPTIMIZE_FORMATS.items() if format_ext == reserved_ext), None)
+        if self.image_optimization is None or ext not in OPTIMIZABLE_EXTS or (reserved and not reserved_format):
+            target_ext = reserved_ext or '.png'
+            if target_ext == ext:
+                return data, ext
+            try:
+                data = self._run_image_task(convert_image, data, Image.registered_extensions()[target_ext])
+            except Exception as e:
+                self.log(f"图片处理失败: {str(e)}，使用原始数据保存")
+                return data, ext
+            return data, target_ext
+        
+        options = dict(self.image_optimization)
+        if reserved_format:
+            options['image_format'] = reserved_format
+        elif convert and not options.get('image_format'):
+            options['image_format'] = 'png'
+        try:
+            optimized, new_ext = self._run_image_task(optimize_image, data, ext, **options)
+        except Exception as e:
+            self.log(f"图片优化失败: {str(e)}，使用原始数据保存")
+            return data, ext
+        self.stats.add('images_optimized')
+        self.stats.add('image_bytes_saved', len(data) - len(optimized))
+        self.log(f"图片优化: {len(data)} -> {len(optimized)} 字节")
+        return optimized, new_ext
+
+    def _count_bytes(self, chunks, response):
+        """逐块传递响应数据并统计字节数"""
+        for chunk in chunks:
+            count_body_bytes(self.stats, response, len(chunk))
+            yield chunk
+
+    def _save_image(self, img_url, index, content_type, head, chunks):
+        """保存下载到的图片，返回Markdown中使用的链接路径
+        
+        Args:
+            img_url (str): 图片URL
+            index (int): 图片序号，为空时自动分配
+            content_type (str): 响应的内容类型
+            head (bytes): 已读取的图片开头部分，用于识别格式
+            chunks (iterable): 图片剩余部分的数据块
+        """
+        # 确保资源目录存在
+        if not self.archive:
+            os.makedirs(self.image_dir, exist_ok=True)
+        self.log(f"图片内容类型: {content_type}")
+        
+        ext = sniff_image_type(head)
+        if not ext:
+            self.log("无法通过文件头识别图片格式，按原始数据保存")
+            ext = image_ext_from_content_type(content_type)
+        
+        # 如果无法从内容类型确定扩展名，从URL获取
+        if not ext:
+            ext = os.path.splitext(urlparse(img_url).path)[1].lower()
+            if not ext:
+                ext = '.jpg'  # 默认使用jpg
+        
+        # 只有需要转换格式或优化的图片才用Pillow解码，其他图片原样写入；
+        # 延迟下载的图片格式与Markdown中已写入的扩展名不一致时也需要转换
+        reserved = self._reserved_paths.get(img_url)
+        convert = ext == '.webp' and self.convert_webp
+        optimize = self.image_optimization is not None and ext in OPTIMIZABLE_EXTS
+        mismatch = reserved is not None and os.path.splitext(reserved)[1] != ext
+        
+        # 生成唯一的图片文件名
+        if index is None:
+            index = self._next_image_index()
+        
+        # 保存图片
+        if convert or optimize or mismatch:
+            img_data, ext = self._process_image(head + b''.join(chunks), ext, convert, reserved)
+            local_path = self._store_image(img_url, index, ext, [img_data])
+        else:
+            local_path = self._store_image(img_url, index, ext, itertools.chain([head], chunks))
+        # 图片写入完成后才计数，读取过程中因超过大小上限而放弃的图片只计入跳过
+        self.stats.add('images_downloaded')
+        self.log(f"图片保存成功: {local_path}")
+        return self._finish_image(img_url, local_path)
+
+    def _existing_image(self, img_url, index):
+        """处理无需下载的图片
+        
+        Returns:
+            tuple: (是否无需下载, 本地路径)；数据URL的本地路径为None
+        """
+        # 同步模式下复用上次转换时已下载的图片
+        previous = self._manifest.get('images', {}).get(img_url)
+        if previous and os.path.exists(self._local_path(previous)):
+            self.log(f"复用上次下载的图片: {previous}")
+            self.stats.add('images_reused')
+            return True, previous
+        
+        # 处理特殊的图片URL（例如数据URL）
+        if img_url.startswith('data:'):
+            self.log(f"跳过数据URL: {img_url[:50]}...")
+            self.stats.add('images_skipped')
+            return True, None
+        
+        # 图片存储中已有该URL时无需下载
+        if self.image_store:
+            blob_path = self.image_store.lookup(img_url)
+            reserved = self._reserved_paths.get(img_url)
+            if blob_path and reserved and os.path.splitext(reserved)[1] != os.path.splitext(blob_path)[1]:
+                # 存储中的格式与Markdown中已写入的扩展名不一致，重新下载并转换
+                blob_path = None
+            if blob_path:
+                self.log(f"图片存储中已有该图片，跳过下载: {img_url}")
+                self.stats.add('images_from_store')
+                return True, self._link_stored_image(img_url, index, blob_path)
+        
+        return False, None
+
+    def _retry_after_status(self, response, attempt):
+        """处理非200响应：可重试的状态码返回等待时间，否则返回None"""
+        if response.status_code in RateLimiter.RETRY_STATUS:
+            self.log(f"HTTP错误: {response.status_code}，稍后重试")
+            return self.rate_limiter.retry_delay(attempt, response)
+        self.log(f"HTTP错误: {response.status_code}")
+        return None
+
+    def _try_download_image(self, img_url, index, attempt):
+        """尝试下载一次图片，不在失败后等待，由调用方安排重试
+        
+        Args:
+            img_url (str): 图片的绝对URL
+            index (int): 图片序号
+            attempt (int): 第几次尝试，从0开始
             
-            print(f"图片下载失败，已尝试 {max_retries} 次")
-            return None
+        Returns:
+            tuple: (本地路径, 重试等待秒数)；无需重试时等待秒数为None
+        """
+        try:
+            self.log(f"尝试下载图片 (尝试 {attempt + 1}/{self.max_retries}): {img_url}")
+            
+            # 使用特定的图片请求头
+            try:
+                headers = self._size_limit_headers(img_url, self.image_headers, self.max_image_size)
+                response = self.session.get(img_url, headers=headers, timeout=30, stream=True)
+            except ResponseTooLarge as e:
+                self.log(f"跳过过大的图片: {str(e)}")
+                self.stats.add('images_skipped')
+                return None, None
+            except requests.exceptions.RequestException as e:
+                self.log(f"请求异常: {str(e)}")
+                return None, self.rate_limiter.retry_delay(attempt)
             
+            self._count_response(response)
+            with response:
+                if response.status_code != 200:
+                    return None, self._retry_after_status(response, attempt)
+                
+                try:
+                    # 读取开头的少量字节，通过文件头识别图片格式
+                    check_content_length(response, self.max_image_size)
+                    chunks = self._count_bytes(
+                        limit_chunks(response.iter_content(64 * 1024), self.max_image_size, img_url), response)
+                    head = b''
+                    for chunk in chunks:
+                        head += chunk
+                        if len(head) >= 16:
+                            break
+                    
+                    content_type = response.headers.get('content-type', '').lower()
+                    return self._save_image(img_url, index, content_type, head, chunks), None
+                
+                except ResponseTooLarge as e:
+                    self.log(f"跳过过大的图片: {str(e)}")
+                    self.stats.add('images_skipped')
+                    return None, None
+                except Exception as e:
+                    self.log(f"保存图片失败: {str(e)}")
+                    return None, self.rate_limiter.retry_delay(attempt)
+        
         except Exception as e:
-            print(f"下载图片时发生错误: {str(e)}")
-            return None
+            self.log(f"下载图片时发生错误: {str(e)}")
+            return None, None
+
+    def download_image(self, img_url, index=None):
+        """下载图片并保存到本地
+
+        Args:
+            img_url (str): 图片URL
+            index (int): 图片序号，用于生成文件名；为空时自动分配
+        """
+        # 处理相对URL
+        if not img_url.startswith(('http://', 'https://')):
+            img_url = urljoin(self.url, img_url)
+        
+        done, path = self._existing_image(img_url, index)
+        if done:
+            return path
+        if index is None:
+            index = self._next_image_index()
+        
+        for attempt in range(self.max_retries):
+            time.sleep(self.rate_limiter.reserve(img_url))
+            path, delay = self._try_download_image(img_url, index, attempt)
+            if delay is None:
+                return path
+            self._retry_later(img_url, delay)
+        
+        self.log(f"图片下载失败，已尝试 {self.max_retries} 次")
+        self.stats.add('images_failed')
+        return None
 
     def clean_html(self, soup):
-        """清理HTML，移除不需要的元素"""
-        # 移除script标签
-        for script in soup.find_all('script'):
-            script.decompose()
+        """清理HTML，移除不需要的元素
         
-        # 移除style标签
-        for style in soup.find_all('style'):
-            style.decompose()
-            
-        # 移除link标签
-        for link in soup.find_all('link'):
-            link.decompose()
-            
-        # 移除meta标签
-        for meta in soup.find_all('meta'):
-            meta.decompose()
+        所有清理步骤都只做固定次数的线性遍历，耗时与节点数成正比。
+        """
+        headings = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+        
+        # 一次遍历收集需要移除的标签、注释以及figure标签
+        removable, comments, figures = [], [], []
+        for node in soup.descendants:
+            if isinstance(node, Tag):
+                if node.name in ('script', 'style', 'link', 'meta'):
+                    removable.append(node)
+                elif node.name == 'figure':
+                    figures.append(node)
+            elif isinstance(node, Comment):
+                comments.append(node)
+        
+        # 移除script、style、link、meta标签
+        for tag in removable:
+            tag.decompose()
             
         # 移除注释
-        for comment in soup.find_all(string=lambda string: isinstance(string, Comment)):
+        for comment in comments:
             comment.extract()
             
         # 处理figure和figcaption
-        for figure in soup.find_all('figure'):
+        for figure in figures:
             # 找到figcaption
             figcaption = figure.find('figcaption')
             if figcaption:
@@ -313,126 +2626,483 @@ class Web2Markdown:
                 next_element = figcaption.next_sibling
                 while next_element and isinstance(next_element, str) and not next_element.strip():
                     next_element = next_element.next_sibling
-                if next_element and next_element.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+                if next_element and next_element.name in headings:
                     br2 = soup.new_tag('br')
                     figcaption.insert_after(br2)
+        
+        # 按文档顺序列出所有标签，并记录第一个和最后一个标题的位置
+        tags = soup.find_all()
+        heading_positions = [i for i, tag in enumerate(tags) if tag.name in headings]
+        first_heading = heading_positions[0] if heading_positions else len(tags)
+        last_heading = heading_positions[-1] if heading_positions else -1
+        
+        # 自底向上计算每个标签内非空白文本的类型，代替对每个标签调用 get_text
+        text_types = {}
+        for tag in reversed(tags):
+            types = set()
+            for child in tag.children:
+                if isinstance(child, Tag):
+                    types |= text_types[id(child)]
+                elif isinstance(child, NavigableString) and child.strip():
+                    types.add(type(child))
+            text_types[id(tag)] = types
             
         # 移除空白标签，但保留可能影响布局的标签
-        for tag in soup.find_all():
+        for position, tag in enumerate(tags):
             # 跳过可能影响布局的标签
             if tag.name in ['figure', 'img', 'br', 'hr', 'div', 'p', 'figcaption']:
                 continue
             # 跳过标题标签
-            if tag.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+            if tag.name in headings:
                 continue
             # 跳过包含图片的标签
             if tag.find_all(['img', 'video', 'iframe'], recursive=False):
                 continue
-            # 跳过标题前后的标签
-            if (tag.find_next(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']) or 
-                tag.find_previous(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])):
+            # 跳过标题前后的标签：文档中在该标签之前或之后存在任意标题
+            if last_heading > position or first_heading < position:
                 continue
-            # 检查标签是否为空
-            if len(tag.get_text(strip=True)) == 0:
+            # 检查标签是否为空（与 get_text(strip=True) 统计的文本类型一致）
+            interesting = tag.interesting_string_types
+            if not isinstance(interesting, tuple):
+                interesting = (interesting,)
+            if not any(t in interesting for t in text_types[id(tag)]):
                 # 将空标签替换为换行符
                 tag.replace_with(soup.new_string('\n'))
 
-        # 标准化标题标签
-        for i, tag in enumerate(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-            for heading in soup.find_all(tag):
-                # 确保标题前后有换行
-                if heading.previous_sibling and isinstance(heading.previous_sibling, str):
-                    heading.insert_before(soup.new_string('\n\n'))
-                if heading.next_sibling and isinstance(heading.next_sibling, str):
-                    heading.insert_after(soup.new_string('\n\n'))
+        # 标准化标题标签
+        for heading in soup.find_all(headings):
+            # 确保标题前后有换行
+            if heading.previous_sibling and isinstance(heading.previous_sibling, str):
+                heading.insert_before(soup.new_string('\n\n'))
+            if heading.next_sibling and isinstance(heading.next_sibling, str):
+                heading.insert_after(soup.new_string('\n\n'))
+        
+        return soup
+
+    def process_html(self, html_content):
+        """处理HTML内容，下载图片并更新图片链接
+        
+        Args:
+            html_content (str | BeautifulSoup): HTML字符串或已解析的文档树
+            
+        Returns:
+            BeautifulSoup: 处理后的文档树
+        """
+        if isinstance(html_content, BeautifulSoup):
+            soup = html_content
+        else:
+            with self.stats.timer('parse'):
+                soup = BeautifulSoup(html_content, self.parser)
+        
+        if not self.quiet:
+            print("\n原始HTML内容中的图片标签:")
+            for img in soup.find_all('img'):
+                print(f"发现原始图片标签: {img}")
+        
+        # 清理HTML
+        with self.stats.timer('clean_html'):
+            soup = self.clean_html(soup)
+        
+        if not self.quiet:
+            print("\n清理后HTML内容中的图片标签:")
+            for img in soup.find_all('img'):
+                print(f"清理后的图片标签: {img}")
+        
+        def find_image_src(img):
+            """获取图片标签中的图片URL"""
+            self.log(f"\n处理图片标签: {img}")
+            # 获取所有可能的图片URL属性
+            src = None
+            for attr in ['src', 'data-src', 'data-original', 'data-actualsrc', 'data-original-src', 'data-src-retina']:
+                src = img.get(attr)
+                if src:
+                    self.log(f"从属性 {attr} 找到图片URL: {src}")
+                    break
+            return src
+        
+        def process_images(images):
+            """先收集全部图片URL，并发下载后再统一更新图片链接"""
+            pending = []
+            for img in images:
+                src = find_image_src(img)
+                if src:
+                    # 转换为绝对URL
+                    abs_url = urljoin(self.url, src)
+                    self.log(f"找到图片URL: {src}，绝对URL: {abs_url}")
+                    pending.append((img, abs_url))
+            
+            with self.stats.timer('images'):
+                local_paths = self.download_images([abs_url for _, abs_url in pending])
+            
+            for img, abs_url in pending:
+                local_path = local_paths.get(abs_url)
+                if local_path:
+                    img['src'] = local_path
+                    # 移除其他可能的图片属性
+                    for attr in ['data-src', 'srcset', 'data-srcset', 'data-original', 'data-actualsrc', 'data-original-src', 'data-src-retina']:
+                        if img.has_attr(attr):
+                            del img[attr]
+                else:
+                    self.log(f"图片下载失败: {abs_url}")
+        
+        # 递归查找所有图片标签
+        self.log("\n开始查找所有图片标签...")
+        all_images = soup.find_all('img', recursive=True)
+        self.log(f"找到 {len(all_images)} 个图片标签")
+        
+        # 处理所有图片
+        process_images(all_images)
+        
+        # 检查是否有遗漏的图片（通过其他属性隐藏的图片）
+        self.log("\n检查可能遗漏的图片...")
+        hidden_images = []
+        for tag in soup.find_all(recursive=True):
+            for attr in ['data-src', 'data-original', 'data-actualsrc', 'data-original-src', 'data-src-retina']:
+                if tag.has_attr(attr):
+                    src = tag.get(attr)
+                    if src and src.startswith(('http://', 'https://')):
+                        self.log(f"发现额外的图片URL在标签 {tag.name}: {src}")
+                        # 创建新的img标签
+                        new_img = soup.new_tag('img')
+                        new_img['src'] = src
+                        tag.append(new_img)
+                        hidden_images.append(new_img)
+        process_images(hidden_images)
+        
+        return soup
+
+    def normalize_headings(self, soup):
+        """确保标题是独立的行：拆分标题前后的文本节点，并在紧跟标题的图片后添加换行"""
+        # 处理所有标题，确保它们是独立的行
+        for heading in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
+            # 如果标题前面有文本节点，将其分割
+            prev_element = heading.previous_sibling
+            if prev_element and isinstance(prev_element, str):
+                text = prev_element.strip()
+                if text:
+                    # 创建新的p标签包含文本
+                    p = soup.new_tag('p')
+                    p.string = text
+                    prev_element.replace_with(p)
+                    # 添加换行
+                    br = soup.new_tag('br')
+                    p.insert_after(br)
+            
+            # 如果标题后面有文本节点，将其分割
+            next_element = heading.next_sibling
+            if next_element and isinstance(next_element, str):
+                text = next_element.strip()
+                if text:
+                    # 创建新的p标签包含文本
+                    p = soup.new_tag('p')
+                    p.string = text
+                    next_element.replace_with(p)
+                    # 添加换行
+                    br = soup.new_tag('br')
+                    heading.insert_after(br)
+        
+        # 处理图片后面的标题
+        for img in soup.find_all('img'):
+            next_element = img.next_sibling
+            while next_element and isinstance(next_element, str) and not next_element.strip():
+                next_element = next_element.next_sibling
+            if next_element and next_element.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
+                br = soup.new_tag('br')
+                img.insert_after(br)
+        
+        return soup
+
+    def _normalize_text_nodes(self, soup):
+        """合并相邻的文本节点，并像解析器一样把纯空白文本压缩为单个换行或空格
+        
+        清理和标题处理会插入新的文本节点。以前的流程会把文档序列化后重新解析，
+        这里在原文档树上得到相同的结果。pre和textarea中的空白保持不变。
+        """
+        stack = [(soup, False)]
+        while stack:
+            tag, preserve = stack.pop()
+            run = []
+            for child in list(tag.children) + [None]:
+                if type(child) is NavigableString:
+                    run.append(child)
+                    continue
+                if run:
+                    text = ''.join(run)
+                    if not preserve and not text.strip(' \n\t\x0c\r'):
+                        text = '\n' if '\n' in text else ' '
+                    if len(run) > 1 or text != run[0]:
+                        run[0].replace_with(NavigableString(text))
+                        for extra in run[1:]:
+                            extra.extract()
+                    run = []
+                if isinstance(child, Tag):
+                    stack.append((child, preserve or child.name in ('pre', 'textarea')))
+        return soup
+
+    def html_to_markdown(self, html_content):
+        """将HTML转换为Markdown
+        
+        整个流程只解析一次：同一棵文档树依次经过清理、图片处理、标题规范化，
+        最后直接交给 markdownify 转换，不再序列化为字符串后重新解析。
+        
+        Args:
+            html_content (str | BeautifulSoup): HTML字符串或已解析的文档树
+            
+        Returns:
+            str: Markdown内容
+        """
+        soup = self.process_html(html_content)
+        
+        with self.stats.timer('markdownify'):
+            # 规范化清理过程中产生的文本节点，与重新解析后的文档树保持一致
+            self._normalize_text_nodes(soup)
+            
+            # 在转换前处理HTML中的标题，确保标题前有换行
+            self.normalize_headings(soup)
+            
+            self.log("\n开始转换为Markdown...")
+            converter = FastMarkdownConverter(
+                heading_style="ATX",
+                bullets="-",
+                strip=['script', 'style', 'meta', 'link', 'xml']
+            )
+            # 保留文档树，EPUB输出时据此生成XHTML章节
+            self._document = soup
+            # 不同解析器补全的空元素（如html5lib的head）可能在开头留下空行
+            return converter.convert_soup(soup).lstrip('\n')
+
+    async def _try_download_image_async(self, img_url, index, attempt):
+        """使用异步抓取引擎尝试下载一次图片，返回值与 _try_download_image 相同"""
+        try:
+            self.log(f"尝试下载图片 (尝试 {attempt + 1}/{self.max_retries}): {img_url}")
+            try:
+                response = await self.fetcher.fetch(img_url, self.image_headers,
+                                                    before_send=lambda: self._wait_backoff(img_url),
+                                                    max_size=self.max_image_size)
+            except ResponseTooLarge as e:
+                self.log(f"跳过过大的图片: {str(e)}")
+                self.stats.add('images_skipped')
+                return None, None
+            except requests.exceptions.RequestException as e:
+                self.log(f"请求异常: {str(e)}")
+                return None, self.rate_limiter.retry_delay(attempt)
+            
+            self._count_response(response)
+            if response.status_code != 200:
+                return None, self._retry_after_status(response, attempt)
+            count_body_bytes(self.stats, response, len(response.content))
+            
+            content_type = response.headers.get('content-type', '').lower()
+            # 写文件和格式转换放到线程池中，避免阻塞事件循环
+            loop = asyncio.get_running_loop()
+            path = await loop.run_in_executor(
+                None, self._save_image, img_url, index, content_type, response.content, [])
+            return path, None
+        
+        except Exception as e:
+            self.log(f"下载图片时发生错误: {str(e)}")
+            return None, None
+
+    async def _wait_backoff(self, url):
+        """等待主机的退避结束，等待期间其他请求可能再次触发退避，因此结束后重新检查"""
+        delay = self.rate_limiter.blocked_for(url)
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.rate_limiter.blocked_for(url)
+
+    async def _download_image_async(self, img_url, index):
+        """使用异步抓取引擎下载图片，退避等待期间不阻塞其他图片的下载"""
+        for attempt in range(self.max_retries):
+            await asyncio.sleep(self.rate_limiter.reserve(img_url))
+            # 预约之后该主机开始退避时，等到退避结束再发送
+            await self._wait_backoff(img_url)
+            path, delay = await self._try_download_image_async(img_url, index, attempt)
+            if delay is None:
+                return path
+            self._retry_later(img_url, delay)
         
-        return soup
+        self.log(f"图片下载失败，已尝试 {self.max_retries} 次")
+        self.stats.add('images_failed')
+        return None
 
-    def process_html(self, html_content):
-        """处理HTML内容，载图片并更新图片链接"""
-        soup = BeautifulSoup(html_content, 'html.parser')
+    async def _download_images_async(self, jobs):
+        return await asyncio.gather(*(self._download_image_async(url, index) for url, index in jobs))
+
+    def _download_scheduled(self, jobs):
+        """使用线程池按主机调度图片下载
         
-        print("\n原始HTML内容中的图片标签:")
-        for img in soup.find_all('img'):
-            print(f"发现原始图片标签: {img}")
+        每次尝试前由限速器给出允许发送请求的时间，到时间后再提交到线程池，
+        等待中的任务不占用线程；某个主机退避期间，其他主机的图片继续下载。
+        """
+        pending = []
+        order = itertools.count()
         
-        # 清理HTML
-        soup = self.clean_html(soup)
+        def schedule(url, index, attempt):
+            ready_at = time.monotonic() + self.rate_limiter.reserve(url)
+            heapq.heappush(pending, (ready_at, next(order), url, index, attempt))
         
-        print("\n清理后HTML内容中的图片标签:")
-        for img in soup.find_all('img'):
-            print(f"清理后的图片标签: {img}")
+        for url, index in jobs:
+            schedule(url, index, 0)
         
-        def process_image(img):
-            """处理单个图片标签"""
-            print(f"\n处理图片标签: {img}")
-            # 获取所有可能的图片URL属性
-            src = None
-            for attr in ['src', 'data-src', 'data-original', 'data-actualsrc', 'data-original-src', 'data-src-retina']:
-                src = img.get(attr)
-                if src:
-                    print(f"从属性 {attr} 找到图片URL: {src}")
-                    break
+        workers = min(self.image_workers, len(jobs))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            running = {}
+            while pending or running:
+                now = time.monotonic()
+                while pending and pending[0][0] <= now and len(running) < workers:
+                    _, _, url, index, attempt = heapq.heappop(pending)
+                    if self.rate_limiter.blocked_for(url):
+                        # 预约之后该主机开始退避，重新预约
+                        schedule(url, index, attempt)
+                        continue
+                    future = executor.submit(self._try_download_image, url, index, attempt)
+                    running[future] = (url, index, attempt)
+                
+                timeout = None
+                if pending and len(running) < workers:
+                    timeout = max(0.0, pending[0][0] - time.monotonic())
+                if not running:
+                    time.sleep(timeout)
+                    continue
+                
+                finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    url, index, attempt = running.pop(future)
+                    path, delay = future.result()
+                    if delay is not None and attempt + 1 < self.max_retries:
+                        self._retry_later(url, delay)
+                        schedule(url, index, attempt + 1)
+                        continue
+                    if delay is not None:
+                        self.log(f"图片下载失败，已尝试 {self.max_retries} 次")
+                        self.stats.add('images_failed')
+                    self._image_paths[url] = path
+
+    def download_images(self, urls):
+        """并发下载一组图片
+        
+        Args:
+            urls (list): 图片的绝对URL列表，按文档顺序排列
             
-            if src:
-                print(f"找到图片URL: {src}")
-                # 转换为绝对URL
-                abs_url = urljoin(self.url, src)
-                print(f"转换为绝对URL: {abs_url}")
-                # 下载图片并获取本地路径
-                local_path = self.download_image(abs_url)
-                if local_path:
-                    print(f"图片已下载到: {local_path}")
-                    img['src'] = local_path
-                    # 移除其他可能的图片属性
-                    for attr in ['data-src', 'srcset', 'data-srcset', 'data-original', 'data-actualsrc', 'data-original-src', 'data-src-retina']:
-                        if img.has_attr(attr):
-                            del img[attr]
-                else:
-                    print(f"图片下载失败: {abs_url}")
+        Returns:
+            dict: 图片URL到本地路径的映射，下载失败的图片映射为None
+            
+        图片序号在提交下载前按文档顺序分配，文件名与下载完成顺序无关；
+        同一URL只下载一次。
+        """
+        jobs = []
+        for url in dict.fromkeys(urls):
+            if url in self._image_paths:
+                continue
+            index = self._next_image_index()
+            done, path = self._existing_image(url, index)
+            if done:
+                self._image_paths[url] = path
+            else:
+                jobs.append((url, index))
         
-        # 递归查找所有图片标签
-        print("\n开始查找所有图片标签...")
-        all_images = soup.find_all('img', recursive=True)
-        print(f"找到 {len(all_images)} 个图片标签")
+        if self.pending_images is not None and jobs:
+            self._defer_images(jobs)
+        elif jobs:
+            self._download_jobs(jobs)
         
-        # 处理每个图片
-        for img in all_images:
-            process_image(img)
+        return {url: self._image_paths[url] for url in urls}
+
+    def _download_jobs(self, jobs):
+        """下载一组 (图片URL, 序号)，结果记录在 _image_paths 中"""
+        if self.fetcher:
+            # 异步引擎：所有图片请求在同一个事件循环中并发执行
+            self.log(f"使用异步引擎并发下载 {len(jobs)} 张图片")
+            paths = self.fetcher.run(self._download_images_async(jobs))
+            for (url, _), path in zip(jobs, paths):
+                self._image_paths[url] = path
+        else:
+            if self.image_workers > 1 and len(jobs) > 1:
+                self.log(f"使用 {min(self.image_workers, len(jobs))} 个线程并发下载 {len(jobs)} 张图片")
+            self._download_scheduled(jobs)
+
+    def _deferred_ext(self, img_url):
+        """延迟下载时按URL和图片处理参数确定扩展名，无法判断时使用.jpg"""
+        image_format = (self.image_optimization or {}).get('image_format')
+        if image_format:
+            return OPTIMIZE_FORMATS[image_format][1]
+        ext = os.path.splitext(urlparse(img_url).path)[1].lower()
+        ext = {'.jpeg': '.jpg', '.tiff': '.tif'}.get(ext, ext)
+        if ext not in KNOWN_IMAGE_EXTS:
+            return '.jpg'
+        if ext == '.webp' and self.convert_webp:
+            return '.png'
+        return ext
+
+    def _defer_images(self, jobs):
+        """为图片分配确定的本地路径并加入待下载列表，不等待下载
         
-        # 检查是否有遗漏的图片（通过其他属性隐藏的图片）
-        print("\n检查可能遗漏的图片...")
-        for tag in soup.find_all(recursive=True):
-            for attr in ['data-src', 'data-original', 'data-actualsrc', 'data-original-src', 'data-src-retina']:
-                if tag.has_attr(attr):
-                    src = tag.get(attr)
-                    if src and src.startswith(('http://', 'https://')):
-                        print(f"发现额外的图片URL在标签 {tag.name}: {src}")
-                        # 创建新的img标签
-                        new_img = soup.new_tag('img')
-                        new_img['src'] = src
-                        tag.append(new_img)
-                        process_image(new_img)
+        路径只由序号、URL哈希和扩展名决定；文件已存在时视为已下载，不再加入列表。
+        """
+        os.makedirs(self.image_dir, exist_ok=True)
+        deferred = []
+        for url, index in jobs:
+            url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
+            local_path = os.path.join(self.image_dir, f'image_{index}_{url_hash}{self._deferred_ext(url)}')
+            if not os.path.exists(local_path):
+                deferred.append((url, local_path))
+            self._image_paths[url] = self._markdown_path(local_path)
+        
+        if deferred:
+            options = {'image_optimization': self.image_optimization, 'convert_webp': self.convert_webp}
+            self.pending_images.add(self.url, deferred, options)
+            self.stats.add('images_deferred', len(deferred))
+            self.log(f"{len(deferred)} 张图片已加入待下载列表: {self.pending_images.path}")
+
+    def fetch_pending_images(self, images):
+        """下载延迟下载的图片，保存到转换时已分配的路径
         
-        return str(soup)
+        Args:
+            images (list): 同一篇文章的 (图片URL, 本地路径) 列表
+            
+        Returns:
+            dict: 本地路径到是否已保存的映射
+        """
+        self._reserved_paths = dict(images)
+        jobs = []
+        for url, path in images:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                done, saved = self._existing_image(url, None)
+                if not done:
+                    jobs.append((url, self._next_image_index()))
+                else:
+                    self._image_paths[url] = saved
+        if jobs:
+            with self.stats.timer('total'), self.stats.timer('images'):
+                self._download_jobs(jobs)
+        
+        results = {}
+        for url, path in images:
+            saved = self._image_paths.get(url)
+            if saved and not os.path.exists(path) and os.path.exists(self._local_path(saved)):
+                # 无法硬链接到图片存储时引用的是存储中的文件，复制到预定路径
+                shutil.copyfile(self._local_path(saved), path)
+            results[path] = os.path.exists(path)
+        return results
 
     def post_process_markdown(self, content):
         """后处理Markdown内容，只处理图片下载"""
-        print("\n开始处理Markdown内容中的图片...")
+        self.log("\n开始处理Markdown内容中的图片...")
         
         # 下载markdown的图片
         def download_md_image(match):
             img_url = match.group(1)
-            print(f"\n发现Markdown图片链接: {img_url}")
+            self.log(f"\n发现Markdown图片链接: {img_url}")
             # 如果不是本地路径，则下载图片
             if img_url.startswith(('http://', 'https://')):
-                print(f"处理远程图片URL: {img_url}")
+                self.log(f"处理远程图片URL: {img_url}")
                 local_path = self.download_image(img_url)
                 if local_path:
-                    print(f"图片已下载到: {local_path}")
+                    self.log(f"图片已下载到: {local_path}")
                     return f'![]({local_path})'
                 else:
-                    print(f"图片下载失败: {img_url}")
+                    self.log(f"图片下载失败: {img_url}")
             return match.group(0)
         
         # 处理所有图片链接，包括带查询参数的URL
@@ -442,112 +3112,1104 @@ class Web2Markdown:
         # 检查是否还有未处理的图片链接
         remaining_images = re.findall(r'!\[.*?\]\((https?://[^\s\)]+)(?:\?[^\s\)]+)?\)', content)
         if remaining_images:
-            print("\n发现未处理的图片链接:")
+            self.log("\n发现未处理的图片链接:")
             for img_url in remaining_images:
-                print(f"- {img_url}")
+                self.log(f"- {img_url}")
                 local_path = self.download_image(img_url)
                 if local_path:
                     content = content.replace(img_url, local_path)
         
         return content.strip() + '\n'
 
-    def convert(self):
-        """将网页转换为Markdown"""
+    def convert(self, exit_on_error=True):
+        """将网页转换为Markdown
+        
+        Args:
+            exit_on_error (bool): 转换失败时是否退出进程；为False时重新抛出异常，
+                便于批量转换时继续处理其他URL
+                
+        Returns:
+            ConversionStats: 本次转换的耗时和计数统计，output_file 属性为输出文件路径
+        """
+        try:
+            with self.stats.timer('total'):
+                self._convert()
+            return self.stats
+                
+        except Exception as e:
+            print(f"转换失败: {str(e)}", file=sys.stderr)
+            if not exit_on_error:
+                raise
+            sys.exit(1)
+
+    def _convert(self):
+        """获取网页内容，转换为Markdown并写入输出文件"""
+        self.log(f"\n开始处理网页: {self.url}")
+        if self.archive_suffix and (self.sync or self.pending_images is not None):
+            raise ValueError("归档输出不支持 --sync 和 --defer-images")
+        if self.sync:
+            self._manifest = self._load_manifest()
+        
         try:
-            print(f"\n开始处理网页: {self.url}")
-            
-            # 获取网页内容
-            if 'zhihu.com' in self.url:
-                html_content = self.get_zhihu_content(self.url)
-                if not html_content:
-                    raise Exception("无法获取知乎文章内容")
-            elif 'segmentfault.com' in self.url:
-                html_content = self.get_segmentfault_content(self.url)
-                if not html_content:
-                    raise Exception("无法获取 SegmentFault 文章内容")
-            else:
-                response = self.session.get(self.url, headers=self.headers, timeout=30)
-                response.raise_for_status()
-                response.encoding = response.apparent_encoding
-                html_content = response.text
-            
-            print("\n开始处理HTML内容...")
-            # 处理HTML内容
-            processed_html = self.process_html(html_content)
+            html_content = self._fetch_content()
+        except NotModified:
+            html_content = None
+        if self.sync and (html_content is None or self._manifest_unchanged()):
+            self.log(f"\n文章没有变化，跳过转换: {self.output_file}")
+            self.stats.unchanged = True
+            return
+        
+        if self.archive_suffix:
+            self._write_archive(html_content)
+        else:
+            markdown_content = self._render_content(html_content)
+            markdown_sha256 = hashlib.sha256(markdown_content.encode('utf-8')).hexdigest()
             
-            # 在转换前处理HTML中的标题，确保标题前有换行
-            soup = BeautifulSoup(processed_html, 'html.parser')
-            
-            # 处理所有标题，确保它们是独立的行
-            for heading in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-                # 如果标题前面有文本节点，将其分割
-                prev_element = heading.previous_sibling
-                if prev_element and isinstance(prev_element, str):
-                    text = prev_element.strip()
-                    if text:
-                        # 创建新的p标签包含文本
-                        p = soup.new_tag('p')
-                        p.string = text
-                        prev_element.replace_with(p)
-                        # 添加换行
-                        br = soup.new_tag('br')
-                        p.insert_after(br)
-                
-                # 如果标题后面有文本节点，将其分割
-                next_element = heading.next_sibling
-                if next_element and isinstance(next_element, str):
-                    text = next_element.strip()
-                    if text:
-                        # 创建新的p标签包含文本
-                        p = soup.new_tag('p')
-                        p.string = text
-                        next_element.replace_with(p)
-                        # 添加换行
-                        br = soup.new_tag('br')
-                        heading.insert_after(br)
-            
-            # 处理图片后面的标题
-            for img in soup.find_all('img'):
-                next_element = img.next_sibling
-                while next_element and isinstance(next_element, str) and not next_element.strip():
-                    next_element = next_element.next_sibling
-                if next_element and next_element.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                    br = soup.new_tag('br')
-                    img.insert_after(br)
+            # 保存Markdown文件；同步模式下内容没有变化时保留原文件
+            if not (self.sync and markdown_sha256 == self._manifest.get('markdown_sha256')
+                    and os.path.exists(self.output_file)):
+                write_file(self.output_file, [markdown_content.encode('utf-8')])
             
-            print("\n开始转换为Markdown...")
-            # 转换为Markdown
-            markdown_content = markdownify(
-                str(soup),
-                heading_style="ATX",
-                bullets="-",
-                strip=['script', 'style', 'meta', 'link', 'xml']
-            )
+            self._write_manifest(markdown_sha256)
+            if self.sync:
+                self._remove_orphaned_images()
             
-            # 保存Markdown文件
-            with open(self.output_file, 'w', encoding='utf-8') as f:
-                f.write(markdown_content)
-                
-            print(f"\n转换完成！文件已保存为: {self.output_file}")
-            if self.image_count > 0:
-                print(f"共下载了 {self.image_count} 张图片，保存在目录: {self.image_dir}")
+        self.log(f"\n转换完成！文件已保存为: {self.output_file}")
+        if self.image_count > 0:
+            location = f"已写入归档: {self.output_file}" if self.archive_suffix else f"保存在目录: {self.image_dir}"
+            self.log(f"共下载了 {self.image_count} 张图片，{location}")
+            if self.stats.counters['images_optimized']:
+                self.log(f"优化了 {self.stats.counters['images_optimized']} 张图片，"
+                         f"节省 {self.stats.counters['image_bytes_saved'] / 1024:.1f} KB")
+        elif self.stats.counters['images_deferred']:
+            self.log(f"{self.stats.counters['images_deferred']} 张图片等待下载，"
+                     f"请运行: web2md.py fetch-images --pending-file {self.pending_images.path}")
+        elif not self.stats.counters['images_reused']:
+            self.log("警告：未发现任何图片需要下载！")
+
+    def _write_archive(self, html_content):
+        """转换文章并写入归档：图片在下载完成时写入，Markdown最后写入
+        
+        归档先写入临时文件，完成后再重命名为输出文件，失败时不留下不完整的归档。
+        """
+        tmp_path = f'{self.output_file}.{os.getpid()}.part'
+        name = os.path.basename(self.output_file)[:-len(self.archive_suffix)] or 'article'
+        try:
+            with open_archive(tmp_path, self.archive_suffix) as archive:
+                self.archive = archive
+                markdown_content = self._render_content(html_content)
+                heading = self._document.find('h1')
+                title = heading.get_text(strip=True) if heading else name
+                archive.add_article(f'{name}.md', markdown_content, self._document, title or name, self.url)
+            os.replace(tmp_path, self.output_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            self.archive = None
+
+    def render(self, reuse_images=False):
+        """获取文章并转换为Markdown，只下载图片，不写入输出文件
+        
+        与 convert() 不同，失败时直接抛出异常，供服务模式等在进程内调用。
+        输出文件路径只用于计算图片的相对链接。
+        
+        Args:
+            reuse_images (bool): 复用上次 render 下载的图片，并在完成后更新清单、
+                删除不再引用的图片，反复转换同一篇文章时图片目录不会增长
+        
+        Returns:
+            str: Markdown内容
+        """
+        self.log(f"\n开始处理网页: {self.url}")
+        if reuse_images:
+            self._manifest = self._load_manifest()
+        with self.stats.timer('total'):
+            markdown = self._render_content(self._fetch_content())
+        if reuse_images:
+            self._write_manifest(hashlib.sha256(markdown.encode('utf-8')).hexdigest())
+            self._remove_orphaned_images()
+        return markdown
+
+    def image_manifest(self):
+        """返回图片URL到Markdown中图片链接路径的映射，不含下载失败的图片"""
+        return {url: path for url, path in self._image_paths.items() if path}
+
+    def _render_content(self, html_content):
+        """普通网站先提取正文，再转换为Markdown"""
+        if self.extract and not self._is_site_article():
+            with self.stats.timer('parse'):
+                html_content = BeautifulSoup(html_content, self.parser)
+            with self.stats.timer('extract'):
+                html_content = self.extract_main_content(html_content)
+        
+        self.log("\n开始处理HTML内容...")
+        return self.html_to_markdown(html_content)
+
+    def _is_site_article(self):
+        """知乎和 SegmentFault 文章由专门的流程获取正文"""
+        return 'zhihu.com' in self.url or 'segmentfault.com' in self.url
+
+    def _fetch_content(self):
+        """获取文章内容，返回HTML字符串或文档树"""
+        if 'zhihu.com' in self.url:
+            html_content = self.get_zhihu_content(self.url)
+            if not html_content:
+                raise Exception("无法获取知乎文章内容")
+        elif 'segmentfault.com' in self.url:
+            html_content = self.get_segmentfault_content(self.url)
+            if not html_content:
+                raise Exception("无法获取 SegmentFault 文章内容")
+        else:
+            html_content = self.fetch_html(self.url)
+        return html_content
+
+
+def read_batch_list(stream):
+    """读取批量转换列表，每行格式为 url<TAB>output，忽略空行和#开头的注释行
+    
+    Returns:
+        list: (行号, url, output) 元组列表，格式错误的行output为None
+    """
+    entries = []
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = [part.strip() for part in line.split('\t')]
+        if len(parts) != 2 or not all(parts):
+            entries.append((line_no, parts[0], None))
+        else:
+            entries.append((line_no, parts[0], parts[1]))
+    return entries
+
+
+def run_batch(entries, workers=4, **options):
+    """使用线程池批量转换多篇文章
+    
+    Args:
+        entries (list): read_batch_list 返回的 (行号, url, output) 列表
+        workers (int): 同时转换的文章数
+        **options: 传给 Web2Markdown 的其他参数（image_dir、image_workers、image_store 等）
+        
+    Returns:
+        list: 与entries顺序一致的 (url, output, 错误信息, 统计) 列表，
+            成功时错误信息为None，失败时统计为None
+    """
+    pool_size = max(1, workers) * max(1, options.get('image_workers', 8))
+    sessions = SessionPool(pool_size=pool_size, http_cache=options.get('http_cache'))
+    
+    def convert_one(entry):
+        line_no, url, output = entry
+        if output is None:
+            return url, output, f"第 {line_no} 行格式错误，应为 url<TAB>output", None
+        try:
+            converter = Web2Markdown(url, output, session=sessions.get(url), **options)
+            stats = converter.convert(exit_on_error=False)
+            return url, output, None, stats
+        except Exception as e:
+            return url, output, str(e), None
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            return list(executor.map(convert_one, entries))
+    finally:
+        sessions.close()
+
+
+def add_conversion_arguments(parser):
+    """添加单篇转换和批量转换共用的命令行参数"""
+    parser.add_argument('-i', '--image-dir', default='i', help='图片存储目录名 (默认: i)')
+    parser.add_argument('--image-workers', type=int, default=8, help='每篇文章并发下载图片的线程数 (默认: 8)')
+    parser.add_argument('--image-store', help='共享图片存储目录，按内容去重并跳过已下载的图片')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'HTTP缓存目录 (默认: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-size', type=int, default=1024, help='HTTP缓存大小上限，单位MB (默认: 1024)')
+    parser.add_argument('--no-cache', action='store_true', help='禁用HTTP缓存')
+    parser.add_argument('--keep-webp', action='store_true', help='保留WebP图片原格式，不转换为PNG')
+    parser.add_argument('--convert-workers', type=int,
+                        help='转换和优化图片的进程数，0 表示在下载线程中直接处理 '
+                             '(默认: 启用图片优化时为CPU核数，否则为0)')
+    parser.add_argument('--optimize-images', action='store_true',
+                        help='重新压缩图片并去除EXIF信息，指定以下任一图片参数时自动启用')
+    parser.add_argument('--max-width', type=int, default=0, help='图片最大宽度，超过时按比例缩小 (默认: 不限制)')
+    parser.add_argument('--max-height', type=int, default=0, help='图片最大高度，超过时按比例缩小 (默认: 不限制)')
+    parser.add_argument('--image-format', choices=list(OPTIMIZE_FORMATS),
+                        help='将图片转换为指定格式，GIF动画除外 (默认: 保持原格式)')
+    parser.add_argument('--image-quality', type=int, default=85,
+                        help='JPEG、WebP、AVIF 图片的压缩质量，1~100 (默认: 85)')
+    parser.add_argument('--engine', default='requests', choices=('requests', 'async'),
+                        help='网络请求引擎，async 使用 httpx 在单个事件循环中并发请求 (默认: requests)')
+    parser.add_argument('--host-connections', type=int, default=8,
+                        help='异步引擎中每个主机的最大并发请求数 (默认: 8)')
+    parser.add_argument('--max-page-size', type=int, default=DEFAULT_MAX_PAGE_SIZE // (1024 * 1024),
+                        help='网页大小上限，单位MB，0表示不限制 (默认: %(default)s)')
+    parser.add_argument('--max-image-size', type=int, default=DEFAULT_MAX_IMAGE_SIZE // (1024 * 1024),
+                        help='单张图片大小上限，超过的图片将被跳过，单位MB，0表示不限制 (默认: %(default)s)')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='没有站点配置的主机每秒最多请求数，0表示不限速 (默认: 0)')
+    parser.add_argument('--site-rate', action='append', default=[], metavar='DOMAIN=RATE[:BURST]',
+                        help='为域名（含子域名）设置每秒请求数和突发请求数，覆盖内置的站点限速，'
+                             '如 zhihu.com=1:2；可多次指定')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='每张图片的最大尝试次数 (默认: 3)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='不输出处理过程日志，只输出错误信息')
+    parser.add_argument('--stats', choices=('text', 'json'),
+                        help='转换完成后输出各阶段耗时和计数统计；json 格式同时关闭处理过程日志，'
+                             '标准输出中只有JSON')
+    parser.add_argument('--profile', choices=('cpu', 'memory'),
+                        help='使用 cProfile 分析CPU耗时，或使用 tracemalloc 分析内存分配')
+    parser.add_argument('--profile-output',
+                        help='保存分析结果的文件（cpu 为 pstats 格式，memory 为 tracemalloc 快照）')
+    parser.add_argument('--no-extract', action='store_true',
+                        help='普通网站不提取正文，转换整个页面')
+    parser.add_argument('--selector', action='append', default=[],
+                        help='正文的CSS选择器，优先于自动识别，可多次指定')
+    parser.add_argument('--site-selectors',
+                        help='按域名配置正文选择器的JSON文件，格式为 {"example.com": ["article", ".post"]}')
+    parser.add_argument('--sync', action='store_true',
+                        help='根据上次转换的清单增量同步：文章未变化时跳过，复用已下载的图片并删除不再引用的图片')
+    parser.add_argument('--defer-images', action='store_true',
+                        help='不等待图片下载，先写入Markdown；图片加入待下载列表，由 fetch-images 子命令下载')
+    parser.add_argument('--pending-file',
+                        help=f'待下载图片列表文件 (默认: 当前目录下的 {PENDING_FILE})')
+    parser.add_argument('--parser', default='auto', choices=('auto',) + PARSER_BACKENDS,
+                        help='HTML解析器，auto 自动选择已安装的最快解析器 (默认: auto)')
+
+
+def load_site_selectors(path):
+    """读取按域名配置正文选择器的JSON文件"""
+    if not path:
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            selectors = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"无法读取正文选择器配置 {path}: {e}")
+    if not isinstance(selectors, dict):
+        raise ValueError(f"正文选择器配置 {path} 应为 域名 -> 选择器列表 的JSON对象")
+    return {domain.lower(): [value] if isinstance(value, str) else list(value)
+            for domain, value in selectors.items()}
+
+
+def parse_site_rates(values):
+    """解析 --site-rate 参数，返回 (域名, 每秒请求数, 突发请求数) 列表"""
+    rates = []
+    for value in values:
+        domain, sep, limit = value.partition('=')
+        rate, _, burst = limit.partition(':')
+        try:
+            rate = float(rate)
+            burst = int(burst) if burst else max(1, int(rate))
+        except ValueError:
+            rate = None
+        if not sep or not domain or rate is None or rate < 0:
+            raise ValueError(f"无效的站点限速: {value}，格式应为 域名=每秒请求数[:突发请求数]")
+        rates.append((domain, rate, burst))
+    return rates
+
+
+def conversion_options(args):
+    """根据命令行参数构造 Web2Markdown 的参数"""
+    rate_limiter = RateLimiter(args.rate, int(args.rate) or 1)
+    for domain, rate, burst in parse_site_rates(args.site_rate):
+        rate_limiter.configure(domain, rate, burst)
+    http_cache = None if args.no_cache else HTTPCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    fetcher = None
+    if args.engine == 'async':
+        fetcher = AsyncFetcher(args.host_connections, http_cache)
+    image_optimization = None
+    if args.optimize_images or args.max_width or args.max_height or args.image_format:
+        if args.image_format == 'avif' and not avif_supported():
+            raise ValueError("当前 Pillow 不支持 AVIF，请升级到 Pillow 11.2 或执行 pip install pillow-avif-plugin")
+        if not 1 <= args.image_quality <= 100:
+            raise ValueError("图片压缩质量必须在 1~100 之间")
+        image_optimization = {
+            'max_width': args.max_width,
+            'max_height': args.max_height,
+            'image_format': args.image_format,
+            'quality': args.image_quality,
+        }
+    convert_workers = args.convert_workers
+    if convert_workers is None:
+        convert_workers = os.cpu_count() if image_optimization else 0
+    return {
+        'image_dir': args.image_dir,
+        'image_workers': args.image_workers,
+        'image_store': ImageStore(args.image_store) if args.image_store else None,
+        'http_cache': http_cache,
+        'fetcher': fetcher,
+        'max_page_size': args.max_page_size * 1024 * 1024,
+        'max_image_size': args.max_image_size * 1024 * 1024,
+        'rate_limiter': rate_limiter,
+        'max_retries': args.retries,
+        # JSON统计输出到标准输出，处理过程日志会破坏JSON格式
+        'quiet': args.quiet or args.stats == 'json',
+        'extract': not args.no_extract,
+        'sync': args.sync,
+        'pending_images': PendingImages(pending_file_path(args)) if args.defer_images else None,
+        'content_selectors': args.selector,
+        'site_selectors': load_site_selectors(args.site_selectors),
+        'parser': resolve_parser(args.parser),
+        'convert_webp': not args.keep_webp,
+        'image_optimization': image_optimization,
+        'convert_pool': ProcessPoolExecutor(convert_workers) if convert_workers > 0 else None,
+    }
+
+
+def close_conversion_options(options):
+    """释放 conversion_options 创建的共享资源"""
+    if options['image_store']:
+        options['image_store'].close()
+    if options['convert_pool']:
+        options['convert_pool'].shutdown()
+    if options['fetcher']:
+        options['fetcher'].close()
+    if options['pending_images']:
+        options['pending_images'].close()
+
+
+def pending_file_path(args):
+    """待下载图片列表的路径，未指定时放在当前目录中
+    
+    列表不放在图片目录中，避免随图片一起发布；旧版本留在图片目录中的列表仍然可以继续使用。
+    """
+    if args.pending_file:
+        return args.pending_file
+    legacy = os.path.join(args.image_dir, LEGACY_PENDING_FILE)
+    if not os.path.exists(PENDING_FILE) and os.path.exists(legacy):
+        return legacy
+    return PENDING_FILE
+
+
+@contextmanager
+def profiling(mode, output=None):
+    """在 with 代码块执行期间进行性能分析，结束后将结果输出到标准错误
+    
+    Args:
+        mode (str): cpu 使用 cProfile，memory 使用 tracemalloc，为空时不分析
+        output (str): 可选，保存完整分析结果的文件
+    """
+    if mode == 'cpu':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if output:
+                profiler.dump_stats(output)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+    elif mode == 'memory':
+        tracemalloc.start(25)
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            if output:
+                snapshot.dump(output)
+            print(f"\n内存分配: 当前 {current / 1024 / 1024:.1f} MB，峰值 {peak / 1024 / 1024:.1f} MB",
+                  file=sys.stderr)
+            for stat in snapshot.statistics('lineno')[:15]:
+                print(stat, file=sys.stderr)
+    else:
+        yield
+
+
+def batch_main(argv):
+    """批量转换命令入口"""
+    parser = argparse.ArgumentParser(prog='web2md.py batch',
+                                     description='批量将网页转换为Markdown格式文件')
+    parser.add_argument('list_file', help='URL列表文件，每行格式为 url<TAB>output；使用 - 从标准输入读取')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='同时转换的文章数 (默认: 4)')
+    add_conversion_arguments(parser)
+    
+    args = parser.parse_args(argv)
+    
+    if args.list_file == '-':
+        entries = read_batch_list(sys.stdin)
+    else:
+        with open(args.list_file, encoding='utf-8') as f:
+            entries = read_batch_list(f)
+    
+    try:
+        options = conversion_options(args)
+    except ValueError as e:
+        parser.error(str(e))
+    start = time.time()
+    try:
+        with profiling(args.profile, args.profile_output):
+            results = run_batch(entries, args.workers, **options)
+    finally:
+        close_conversion_options(options)
+    elapsed = time.time() - start
+    
+    if report_batch(results, elapsed, args):
+        sys.exit(1)
+
+
+def report_batch(results, elapsed, args):
+    """输出批量转换的结果和统计，返回失败的文章数"""
+    succeeded = [r for r in results if r[2] is None]
+    failed = [r for r in results if r[2] is not None]
+    throughput = len(results) / elapsed if elapsed > 0 else 0
+    
+    if args.stats == 'json':
+        print(json.dumps({
+            'elapsed': round(elapsed, 4),
+            'succeeded': len(succeeded),
+            'failed': len(failed),
+            'results': [stats.as_dict() if stats else {'url': url, 'output_file': output, 'error': error}
+                        for url, output, error, stats in results],
+        }, ensure_ascii=False, indent=2))
+    else:
+        print("\n批量转换结果:")
+        for url, output, error, stats in results:
+            if error is None:
+                if not args.quiet or args.stats == 'text':
+                    print(f"[成功] {url} -> {output}")
+                if args.stats == 'text':
+                    print(stats.format())
             else:
-                print("警告：未发现任何图片需要下载！")
-                
+                print(f"[失败] {url}: {error}")
+        
+        print(f"\n共 {len(results)} 篇，成功 {len(succeeded)} 篇，失败 {len(failed)} 篇，"
+              f"耗时 {elapsed:.2f} 秒，吞吐 {throughput:.2f} 篇/秒")
+    return len(failed)
+
+
+class ConversionService:
+    """常驻转换服务
+    
+    会话连接池、HTTP缓存、图片存储、限速器等资源在服务启动时创建，所有请求共享。
+    同时执行的转换数为 workers，另有 queue_size 个请求可以排队等待；
+    超出时 submit() 返回None，由HTTP层返回429。
+    """
+    
+    def __init__(self, output_dir, workers=4, queue_size=16, timeout=120, **options):
+        self.output_dir = os.path.abspath(output_dir)
+        self.timeout = timeout
+        self.options = options
+        self.sessions = SessionPool(pool_size=max(1, workers) * max(1, options.get('image_workers', 8)),
+                                    http_cache=options.get('http_cache'))
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._slots = threading.BoundedSemaphore(max(1, workers) + max(0, queue_size))
+        self._lock = threading.Lock()
+        # 同一URL的转换共用一个目录，依次执行；目录 -> [锁, 持有或等待的任务数]
+        self._job_locks = {}
+        self.pending = 0
+    
+    def submit(self, url):
+        """提交转换任务，队列已满时返回None"""
+        if not self._slots.acquire(blocking=False):
+            return None
+        with self._lock:
+            self.pending += 1
+        try:
+            return self.executor.submit(self._convert, url)
+        except BaseException:
+            self._release()
+            raise
+    
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+    
+    @contextmanager
+    def _job_lock(self, job_dir):
+        """独占任务目录；没有任务持有或等待时删除对应的锁，锁的数量不随处理过的URL增长"""
+        with self._lock:
+            entry = self._job_locks.setdefault(job_dir, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._job_locks[job_dir]
+    
+    def _convert(self, url):
+        """在工作线程中转换一篇文章，图片保存在按URL区分的目录中
+        
+        再次转换同一URL时复用目录中已下载的图片，并删除不再引用的图片。
+        """
+        try:
+            job_dir = os.path.join(self.output_dir, hashlib.sha1(url.encode()).hexdigest()[:16])
+            with self._job_lock(job_dir):
+                converter = Web2Markdown(url, os.path.join(job_dir, 'article.md'),
+                                         session=self.sessions.get(url),
+                                         **dict(self.options, image_dir=os.path.join(job_dir, 'images')))
+                markdown = converter.render(reuse_images=True)
+            return {
+                'url': url,
+                'markdown': markdown,
+                'base_dir': job_dir,
+                'images': converter.image_manifest(),
+                'stats': converter.stats.as_dict(),
+            }
+        finally:
+            self._release()
+    
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.sessions.close()
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """转换服务的HTTP接口
+    
+    POST /convert  请求体为 {"url": "...", "timeout": 秒}，返回Markdown和图片清单
+    GET  /health   返回服务状态
+    """
+    
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        if not self.server.service.options.get('quiet'):
+            super().log_message(format, *args)
+    
+    def send_json(self, status, data, headers=()):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if self.path != '/health':
+            return self.send_json(404, {'error': '未知的接口'})
+        self.send_json(200, {'status': 'ok', 'pending': self.server.service.pending})
+    
+    def do_POST(self):
+        if self.path != '/convert':
+            return self.send_json(404, {'error': '未知的接口'})
+        service = self.server.service
+        
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            url = payload['url']
+            if not isinstance(url, str) or not url.startswith(('http://', 'https://')):
+                raise ValueError
+            timeout = min(float(payload.get('timeout', service.timeout)), service.timeout)
+        except (KeyError, TypeError, ValueError):
+            return self.send_json(400, {'error': '请求体应为 {"url": "http(s)://..."} 格式的JSON'})
+        
+        future = service.submit(url)
+        if future is None:
+            return self.send_json(429, {'error': '转换队列已满，请稍后重试'}, [('Retry-After', '1')])
+        
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # 工作线程无法中断，任务会在后台继续执行，完成后释放队列位置
+            return self.send_json(504, {'error': f'转换超过 {timeout:g} 秒未完成', 'url': url})
         except Exception as e:
-            print(f"转换失败: {str(e)}")
-            sys.exit(1)
+            return self.send_json(502, {'error': str(e), 'url': url})
+        self.send_json(200, result)
+
+
+def fetch_images(pending, workers=4, max_attempts=0, **options):
+    """下载待下载列表中的图片，多篇文章的图片同时下载
+    
+    Args:
+        pending (PendingImages): 待下载图片列表，保存成功的图片会从列表中删除
+        workers (int): 同时处理的文章数
+        max_attempts (int): 跳过已经失败这么多次的图片，0 表示不跳过
+        **options: 传给 Web2Markdown 的其他参数；图片处理参数使用转换时记录的设置
+        
+    Returns:
+        list: (文章URL, 保存成功数, 失败数, 统计) 列表
+    """
+    articles = pending.articles(max_attempts)
+    pool_size = max(1, workers) * max(1, options.get('image_workers', 8))
+    sessions = SessionPool(pool_size=pool_size, http_cache=options.get('http_cache'))
+    
+    def fetch_one(item):
+        article_url, image_options, images = item
+        # 图片路径已经确定，输出文件只用于计算相对路径
+        converter = Web2Markdown(article_url, images[0][1], session=sessions.get(article_url),
+                                 **dict(options, **image_options))
+        results = converter.fetch_pending_images(images)
+        for path, saved in results.items():
+            if saved:
+                pending.done(path)
+            else:
+                pending.failed(path)
+        saved = sum(results.values())
+        return article_url, saved, len(results) - saved, converter.stats
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            return list(executor.map(fetch_one, articles))
+    finally:
+        sessions.close()
+
+
+def fetch_images_main(argv):
+    """下载延迟图片命令入口"""
+    parser = argparse.ArgumentParser(prog='web2md.py fetch-images',
+                                     description='下载使用 --defer-images 转换时延迟的图片')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='同时处理的文章数 (默认: 4)')
+    parser.add_argument('--max-attempts', type=int, default=0,
+                        help='跳过已经失败这么多次的图片，0 表示全部重试 (默认: 0)')
+    add_conversion_arguments(parser)
+    
+    args = parser.parse_args(argv)
+    if not os.path.exists(pending_file_path(args)):
+        parser.error(f"待下载图片列表不存在: {pending_file_path(args)}")
+    args.defer_images = True
+    
+    try:
+        options = conversion_options(args)
+    except ValueError as e:
+        parser.error(str(e))
+    pending = options['pending_images']
+    start = time.time()
+    try:
+        with profiling(args.profile, args.profile_output):
+            results = fetch_images(pending, args.workers, args.max_attempts,
+                                   **dict(options, pending_images=None))
+        remaining = len(pending)
+    finally:
+        close_conversion_options(options)
+    elapsed = time.time() - start
+    
+    saved = sum(r[1] for r in results)
+    failed = sum(r[2] for r in results)
+    if args.stats == 'json':
+        print(json.dumps({
+            'elapsed': round(elapsed, 4),
+            'saved': saved,
+            'failed': failed,
+            'remaining': remaining,
+            'results': [stats.as_dict() for _, _, _, stats in results],
+        }, ensure_ascii=False, indent=2))
+    else:
+        for article_url, article_saved, article_failed, stats in results:
+            if article_failed:
+                print(f"[失败] {article_url}: 保存 {article_saved} 张，失败 {article_failed} 张")
+            elif not args.quiet or args.stats == 'text':
+                print(f"[成功] {article_url}: 保存 {article_saved} 张")
+            if args.stats == 'text':
+                print(stats.format())
+        print(f"\n共 {len(results)} 篇文章，保存 {saved} 张图片，失败 {failed} 张，"
+              f"剩余 {remaining} 张待下载，耗时 {elapsed:.2f} 秒")
+    
+    if failed:
+        sys.exit(1)
 
-def main():
-    parser = argparse.ArgumentParser(description='将网页转换为Markdown格式文件')
+
+# 知乎导出进度文件的默认文件名，位于输出目录中
+ZHIHU_CHECKPOINT = '.zhihu-export.json'
+
+
+def export_zhihu(listing_url, output_dir, workers=4, checkpoint=None, **options):
+    """导出知乎专栏或作者的全部文章
+    
+    逐页获取文章列表，每页的文章在线程池中并发转换，同时获取下一页；
+    一页的文章全部处理完后，把下一页的接口地址写入进度文件。中断后重新运行
+    会从进度文件记录的页面继续，上次已经全部导出时从第一页重新开始。
+    列表接口和文章接口都使用知乎的请求头，并共享同一个限速器。
+    
+    Args:
+        listing_url (str): 知乎专栏或作者主页URL
+        output_dir (str): 输出目录，文章保存为 <文章ID>.md
+        workers (int): 同时转换的文章数
+        checkpoint (str): 进度文件路径，默认为输出目录中的 .zhihu-export.json
+        **options: 传给 Web2Markdown 的其他参数；相对路径的图片目录位于输出目录中
+        
+    Returns:
+        list: 本次转换的 (url, output, 错误信息, 统计) 列表，格式与 run_batch 相同
+    """
+    api_url = Web2Markdown.zhihu_listing_api(listing_url)
+    if api_url is None:
+        raise ValueError(f"不是知乎专栏或作者主页: {listing_url}")
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = checkpoint or os.path.join(output_dir, ZHIHU_CHECKPOINT)
+    image_dir = options.get('image_dir', 'i')
+    if not os.path.isabs(image_dir):
+        options['image_dir'] = os.path.join(output_dir, image_dir)
+    
+    try:
+        with open(checkpoint, encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    if not isinstance(state, dict) or state.get('url') != listing_url or not state.get('next'):
+        state = {'url': listing_url, 'next': api_url, 'converted': 0, 'failed': []}
+    elif not options.get('quiet'):
+        print(f"从上次中断的位置继续导出，已导出 {state['converted']} 篇: {state['next']}")
+    
+    def save_checkpoint():
+        data = json.dumps(state, ensure_ascii=False, indent=2).encode('utf-8')
+        write_file(checkpoint, [data])
+    
+    def convert_one(url):
+        output = os.path.join(output_dir, url.rstrip('/').rsplit('/', 1)[-1] + '.md')
+        try:
+            converter = Web2Markdown(url, output, session=sessions.get(url), **options)
+            return url, output, None, converter.convert(exit_on_error=False)
+        except Exception as e:
+            return url, output, str(e), None
+    
+    pool_size = max(1, workers) * max(1, options.get('image_workers', 8))
+    sessions = SessionPool(pool_size=pool_size, http_cache=options.get('http_cache'))
+    # 列表页只用于获取知乎的请求头配置，不写入任何文件
+    lister = Web2Markdown(listing_url, None, session=sessions.get(api_url), **options)
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor, \
+                ThreadPoolExecutor(max_workers=1) as listing_executor:
+            page = lister.list_zhihu_articles(state['next'])
+            while page:
+                urls, next_url = page
+                futures = [executor.submit(convert_one, url) for url in urls]
+                # 转换本页文章的同时获取下一页
+                next_page = listing_executor.submit(lister.list_zhihu_articles, next_url) if next_url else None
+                page_results = [future.result() for future in futures]
+                results.extend(page_results)
+                
+                # 先保存本页的进度，获取下一页失败时不会丢失
+                failed = [url for url, _, error, _ in page_results if error is not None]
+                state['converted'] += len(page_results) - len(failed)
+                state['failed'] += failed
+                state['next'] = next_url
+                save_checkpoint()
+                page = next_page.result() if next_page else None
+    finally:
+        sessions.close()
+    return results
+
+
+def zhihu_export_main(argv):
+    """导出知乎专栏或作者文章命令入口"""
+    parser = argparse.ArgumentParser(prog='web2md.py zhihu-export',
+                                     description='导出知乎专栏或作者的全部文章，可中断后继续')
+    parser.add_argument('url', help='专栏或作者主页URL，如 https://zhuanlan.zhihu.com/<专栏> '
+                                    '或 https://www.zhihu.com/people/<用户>')
+    parser.add_argument('-o', '--output-dir', default='zhihu-export',
+                        help='输出目录，文章保存为 <文章ID>.md (默认: zhihu-export)')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='同时转换的文章数 (默认: 4)')
+    parser.add_argument('--checkpoint', help=f'导出进度文件 (默认: <输出目录>/{ZHIHU_CHECKPOINT})')
+    add_conversion_arguments(parser)
+    
+    args = parser.parse_args(argv)
+    if Web2Markdown.zhihu_listing_api(args.url) is None:
+        parser.error(f"不是知乎专栏或作者主页: {args.url}")
+    
+    try:
+        options = conversion_options(args)
+    except ValueError as e:
+        parser.error(str(e))
+    start = time.time()
+    try:
+        with profiling(args.profile, args.profile_output):
+            results = export_zhihu(args.url, args.output_dir, args.workers, args.checkpoint, **options)
+    except Exception as e:
+        print(f"导出失败: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        close_conversion_options(options)
+    elapsed = time.time() - start
+    
+    if report_batch(results, elapsed, args):
+        sys.exit(1)
+
+
+# 任务队列中没有可领取的任务时，最长等待这么多秒后再次检查
+QUEUE_POLL_INTERVAL = 5
+
+
+def work_queue(queue, workers=4, wait=False, **options):
+    """从任务队列领取并转换文章，直到队列中没有等待或正在执行的任务
+    
+    每个线程使用独立的领取者标识；后台线程每隔三分之一租约时长为正在转换的任务续约。
+    相对的输出路径和图片目录按队列文件所在目录解析，各台机器的工作目录可以不同。
+    
+    Args:
+        queue (JobQueue): 任务队列
+        workers (int): 同时转换的文章数
+        wait (bool): 队列清空后继续等待新任务，不退出
+        **options: 传给 Web2Markdown 的其他参数
+        
+    Returns:
+        list: 本进程执行的每次转换的 (url, output, 错误信息, 统计) 列表
+    """
+    base_dir = os.path.dirname(os.path.abspath(queue.path))
+    image_dir = options.get('image_dir', 'i')
+    if not os.path.isabs(image_dir):
+        options['image_dir'] = os.path.join(base_dir, image_dir)
+    prefix = f'{socket.gethostname()}:{os.getpid()}'
+    pool_size = max(1, workers) * max(1, options.get('image_workers', 8))
+    sessions = SessionPool(pool_size=pool_size, http_cache=options.get('http_cache'))
+    active = {}
+    active_lock = threading.Lock()
+    stopped = threading.Event()
+    
+    def heartbeat():
+        while not stopped.wait(queue.lease / 3):
+            with active_lock:
+                jobs = list(active.items())
+            for owner, url in jobs:
+                if not queue.heartbeat(url, owner):
+                    print(f"警告：任务租约已被其他进程接管: {url}", file=sys.stderr)
+    
+    def worker(index):
+        owner = f'{prefix}:{index}'
+        results = []
+        while True:
+            job = queue.claim(owner)
+            if job is None:
+                delay = queue.next_wakeup()
+                if delay is None and not wait:
+                    return results
+                time.sleep(min(delay if delay is not None else QUEUE_POLL_INTERVAL, QUEUE_POLL_INTERVAL))
+                continue
+            
+            url, output, attempt = job
+            with active_lock:
+                active[owner] = url
+            try:
+                output_path = os.path.join(base_dir, output)
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                converter = Web2Markdown(url, output_path, session=sessions.get(url), **options)
+                stats = converter.convert(exit_on_error=False)
+            except Exception as e:
+                error = str(e)
+                if queue.fail(url, owner, error):
+                    error += f"（第 {attempt} 次尝试，稍后重试）"
+                results.append((url, output, error, None))
+            else:
+                if not queue.complete(url, owner, stats.as_dict()):
+                    print(f"警告：任务租约已过期，结果由其他进程记录: {url}", file=sys.stderr)
+                results.append((url, output, None, stats))
+            finally:
+                with active_lock:
+                    del active[owner]
+    
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            return [result for results in executor.map(worker, range(max(1, workers))) for result in results]
+    finally:
+        stopped.set()
+        heartbeat_thread.join()
+        sessions.close()
+
+
+def final_job_results(results):
+    """每个任务只保留最终结果：成功过的取成功结果，否则取最后一次失败，按首次出现的顺序排列
+    
+    work_queue 返回每一次尝试的结果，同一任务失败后重试会出现多次。
+    """
+    final = {}
+    for result in results:
+        url, _, error, _ = result
+        if url not in final or final[url][2] is not None:
+            final[url] = result
+    return list(final.values())
+
+
+def open_job_queue(args):
+    """按命令行参数打开任务队列"""
+    return JobQueue(args.queue_file, lease=args.lease, max_attempts=args.max_attempts,
+                    retry_delay=args.retry_delay, max_retry_delay=args.max_retry_delay,
+                    journal_mode=args.journal_mode)
+
+
+def queue_worker_process(args):
+    """在工作进程中打开队列和转换资源并执行任务，由 --processes 启动"""
+    options = conversion_options(args)
+    queue = open_job_queue(args)
+    try:
+        return work_queue(queue, args.workers, args.wait, **options)
+    finally:
+        queue.close()
+        close_conversion_options(options)
+
+
+def queue_main(argv):
+    """任务队列命令入口"""
+    parser = argparse.ArgumentParser(prog='web2md.py queue',
+                                     description='通过共享的任务队列在多个进程或多台机器上转换文章')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    add_parser = commands.add_parser('add', help='加入任务')
+    add_parser.add_argument('queue_file', help='队列文件（SQLite数据库）')
+    add_parser.add_argument('list_file', help='URL列表文件，每行格式为 url<TAB>output；使用 - 从标准输入读取。'
+                                              '相对的输出路径按队列文件所在目录解析')
+    
+    work_parser = commands.add_parser('work', help='领取并执行任务')
+    work_parser.add_argument('queue_file', help='队列文件（SQLite数据库）')
+    work_parser.add_argument('-w', '--workers', type=int, default=4, help='每个进程同时转换的文章数 (默认: 4)')
+    work_parser.add_argument('--processes', type=int, default=1, help='启动的工作进程数 (默认: 1)')
+    work_parser.add_argument('--wait', action='store_true', help='队列清空后继续等待新任务')
+    add_conversion_arguments(work_parser)
+    
+    status_parser = commands.add_parser('status', help='查看队列状态和失败的任务')
+    status_parser.add_argument('queue_file', help='队列文件（SQLite数据库）')
+    
+    for subparser in (add_parser, work_parser, status_parser):
+        subparser.add_argument('--lease', type=float, default=300,
+                               help='任务租约时长（秒），超时未续约的任务会被重新领取 (默认: 300)')
+        subparser.add_argument('--max-attempts', type=int, default=3, help='每个任务最多尝试的次数 (默认: 3)')
+        subparser.add_argument('--retry-delay', type=float, default=30,
+                               help='第一次失败后的重试间隔（秒），之后每次加倍 (默认: 30)')
+        subparser.add_argument('--max-retry-delay', type=float, default=3600,
+                               help='重试间隔的上限（秒） (默认: 3600)')
+        subparser.add_argument('--journal-mode', choices=['wal', 'delete'], default='wal',
+                               help='SQLite日志模式；WAL只支持同一台机器上的进程，'
+                                    '队列文件放在网络文件系统上时使用 delete (默认: wal)')
+    
+    args = parser.parse_args(argv)
+    if args.command != 'add' and not os.path.exists(args.queue_file):
+        parser.error(f"队列文件不存在: {args.queue_file}")
+    
+    if args.command == 'add':
+        if args.list_file == '-':
+            entries = read_batch_list(sys.stdin)
+        else:
+            with open(args.list_file, encoding='utf-8') as f:
+                entries = read_batch_list(f)
+        for line_no, url, output in entries:
+            if output is None:
+                parser.error(f"第 {line_no} 行格式错误，应为 url<TAB>output")
+        queue = open_job_queue(args)
+        try:
+            added = queue.add([(url, output) for _, url, output in entries])
+        finally:
+            queue.close()
+        print(f"加入 {added} 个任务，{len(entries) - added} 个已在队列中")
+        return
+    
+    if args.command == 'status':
+        queue = open_job_queue(args)
+        try:
+            counts, failures = queue.counts(), queue.failures()
+        finally:
+            queue.close()
+        print(f"等待 {counts['pending']}，执行中 {counts['running']}，完成 {counts['done']}，失败 {counts['failed']}")
+        for url, output, attempts, error in failures:
+            print(f"[失败] {url} -> {output}（尝试 {attempts} 次）: {error}")
+        return
+    
+    try:
+        # 在启动工作进程前检查转换参数
+        close_conversion_options(conversion_options(args))
+    except ValueError as e:
+        parser.error(str(e))
+    start = time.time()
+    with profiling(args.profile, args.profile_output):
+        if args.processes > 1:
+            with ProcessPoolExecutor(max_workers=args.processes) as executor:
+                futures = [executor.submit(queue_worker_process, args) for _ in range(args.processes)]
+                results = [result for future in futures for result in future.result()]
+        else:
+            results = queue_worker_process(args)
+    elapsed = time.time() - start
+    
+    report_batch(final_job_results(results), elapsed, args)
+    queue = open_job_queue(args)
+    try:
+        counts = queue.counts()
+    finally:
+        queue.close()
+    if args.stats != 'json':
+        print(f"队列状态: 等待 {counts['pending']}，执行中 {counts['running']}，"
+              f"完成 {counts['done']}，失败 {counts['failed']}")
+    if counts['failed']:
+        sys.exit(1)
+
+
+def serve_main(argv):
+    """转换服务命令入口"""
+    parser = argparse.ArgumentParser(prog='web2md.py serve',
+                                     description='以HTTP接口提供网页转Markdown服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='监听端口 (默认: 8080)')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='同时转换的文章数 (默认: 4)')
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help='排队等待的最大请求数，超出时返回429 (默认: 16)')
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='单个请求的最长等待时间（秒），超时返回504 (默认: 120)')
+    parser.add_argument('-o', '--output-dir', default='web2md-serve',
+                        help='保存图片的目录，每个URL一个子目录 (默认: web2md-serve)')
+    add_conversion_arguments(parser)
+    
+    args = parser.parse_args(argv)
+    
+    try:
+        options = conversion_options(args)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    service = ConversionService(args.output_dir, args.workers, args.queue_size, args.timeout, **options)
+    server = ThreadingHTTPServer((args.host, args.port), ConversionRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    print(f"转换服务已启动: http://{args.host}:{server.server_address[1]}/convert")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        close_conversion_options(options)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'batch':
+        return batch_main(argv[1:])
+    if argv and argv[0] == 'serve':
+        return serve_main(argv[1:])
+    if argv and argv[0] == 'fetch-images':
+        return fetch_images_main(argv[1:])
+    if argv and argv[0] == 'zhihu-export':
+        return zhihu_export_main(argv[1:])
+    if argv and argv[0] == 'queue':
+        return queue_main(argv[1:])
+    
+    parser = argparse.ArgumentParser(description='将网页转换为Markdown格式文件',
+                                     epilog='批量转换请使用: web2md.py batch <URL列表文件>；'
+                                            '转换服务请使用: web2md.py serve；'
+                                            '下载延迟的图片请使用: web2md.py fetch-images；'
+                                            '导出知乎专栏或作者请使用: web2md.py zhihu-export；'
+                                            '多进程或多台机器协同转换请使用: web2md.py queue')
     parser.add_argument('url', help='网页URL')
     parser.add_argument('output', help='输出文件名')
-    parser.add_argument('-i', '--image-dir', default='i', help='图片存储目录名 (默认: i)')
+    add_conversion_arguments(parser)
+    
+    args = parser.parse_args(argv)
+    
+    try:
+        options = conversion_options(args)
+    except ValueError as e:
+        parser.error(str(e))
     
-    args = parser.parse_args()
+    converter = Web2Markdown(args.url, args.output, **options)
+    try:
+        with profiling(args.profile, args.profile_output):
+            stats = converter.convert()
+    finally:
+        close_conversion_options(options)
     
-    converter = Web2Markdown(args.url, args.output, args.image_dir)
-    converter.convert()
+    if args.stats == 'json':
+        print(json.dumps(stats.as_dict(), ensure_ascii=False, indent=2))
+    elif args.stats == 'text':
+        print(stats.format())
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file